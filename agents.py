@@ -1,9 +1,14 @@
 import json
-from cnn_inference import SnakeInference
-from game import GameState, Player
-from search import minDistanceToFoodBfs
-from typing import Any, Optional, Tuple, List
+from cnn_inference import BoardEncoder, SnakeInference
+from game import Actions, GameState, Player
+from search import minDistanceToFoodBfs, voronoiTerritory
+from ordering import HeuristicMoveOrdering, MoveOrdering
+from transposition import EvaluationCache, TranspositionTable
+from typing import Any, Callable, Dict, Optional, Set, Tuple, List
+import math
+import numpy as np
 import random
+import time
 
 class Agent:
     def getAction(self, gameState: GameState) -> Optional[str]:
@@ -36,11 +41,31 @@ class RandomEnemyAgent(Agent):
 
         return selectedChoice
     
+class SearchModes:
+    # every opponent is a minimizer
+    PARANOID = 'paranoid'
+    # only the opponent whose head is closest to ours is a minimizer
+    NEAREST_THREAT = 'nearest'
+    # only opponents whose heads are within the threat radius of ours are minimizers
+    RADIUS = 'radius'
+
 class MinimaxAgent(Agent):
     WIN_REWARD = 100000
+    THREAT_RADIUS = 4
+    # weight of our Voronoi territory lead over the best opponent in evaluationFunction, 0 leaves it out
+    TERRITORY_WEIGHT = 0.0
 
-    def __init__(self, depth: int) -> None:
+    def __init__(self, depth: int, searchMode: str = SearchModes.PARANOID, threatRadius: int = THREAT_RADIUS) -> None:
         self.depth = depth
+        self.searchMode = searchMode
+        self.threatRadius = threatRadius
+        # opponents searched as minimizers, None for all of them. Set by selectOpponents for each search
+        self.searchedOpponents: Optional[Set[int]] = None
+        # mixed into position hashes, so results under different opponent models don't mix
+        self.opponentsKey = 0
+        # evaluations kept across the turns of one game, set per game by the server
+        self.evaluationCache: Optional[EvaluationCache] = None
+        self.territoryWeight = MinimaxAgent.TERRITORY_WEIGHT
 
     def getAction(self, gameState: GameState) -> Optional[str]:
         # print(f"Game state: {gameState}")
@@ -50,6 +75,7 @@ class MinimaxAgent(Agent):
             # our player is not alive
             return None
 
+        self.selectOpponents(gameState)
         (bestValue, bestMove) = self.vminimax(gameState, 0, self.depth)
 
         if bestMove is None:
@@ -64,7 +90,7 @@ class MinimaxAgent(Agent):
         
     def vminimax(self, gameState: GameState, index: int, depth: int) -> Tuple[float, Optional[str]]:
         if depth == 0 or gameState.isEndState() or len(gameState.players) <= 1:
-            return (self.evaluationFunction(gameState), None)
+            return (self.cachedEvaluation(gameState), None)
         
         if index == 0:
             # Our move (maximizing)
@@ -72,7 +98,11 @@ class MinimaxAgent(Agent):
             if (len(legalMoves) == 0):
                 return (-MinimaxAgent.WIN_REWARD, None)
 
-            values = [self.vminimax(gameState.generateSuccessor(move, 0), 1, depth)[0] for move in legalMoves]
+            values = []
+            for move in legalMoves:
+                undo = gameState.makeMove(move, 0, False)
+                values.append(self.vminimax(gameState, 1, depth)[0])
+                gameState.unmakeMove(undo)
             bestValue = max(values)
             bestMoves = [legalMoves[i] for i in range(len(values)) if values[i] == bestValue]
             # if depth != self.depth:
@@ -86,9 +116,16 @@ class MinimaxAgent(Agent):
             
             if (len(legalMoves) == 0) or not gameState.players[index].alive:
                 # go to the next agent
-                return self.vminimax(gameState.generateSuccessor(None, index), self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState))
-
-            values = [self.vminimax(gameState.generateSuccessor(move, index), self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState))[0] for move in legalMoves]
+                undo = gameState.makeMove(None, index)
+                result = self.vminimax(gameState, self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState))
+                gameState.unmakeMove(undo)
+                return result
+
+            values = []
+            for move in self.opponentMoves(gameState, index, legalMoves):
+                undo = gameState.makeMove(move, index, False)
+                values.append(self.vminimax(gameState, self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState))[0])
+                gameState.unmakeMove(undo)
             bestValue = min(values)
             # print(f"vminimax at depth {depth}, index {index}: {(bestValue, bestMoves[0])}")
 
@@ -110,8 +147,8 @@ class MinimaxAgent(Agent):
             foodDistance = 0
             foodScore = 0
         else:
-            foodDistance = minDistanceToFoodBfs(x, y, gameState.food, gameState.getWalls(), gameState.width, gameState.height)
-            if minDistanceToFoodBfs == -1:
+            foodDistance = minDistanceToFoodBfs(x, y, gameState.getFoodMask(), gameState.getWallMask(), gameState.width, gameState.height)
+            if foodDistance == -1:
                 foodScore = 0
             else:
                 healthGainFromFood = Player.MAX_HEALTH - gameState.players[0].health
@@ -119,11 +156,70 @@ class MinimaxAgent(Agent):
 
         # print(f"food score: {foodScore}, distance: {foodDistance}, ({x}, {y}) to {gameState.food}")
 
-        return gameState.players[0].health + foodScore
+        territoryScore = 0.0
+        if self.territoryWeight != 0 and len(gameState.players) > 1:
+            territory = voronoiTerritory(gameState)
+            territoryScore = self.territoryWeight * (territory[0] - max(territory[1:]))
+
+        return gameState.players[0].health + foodScore + territoryScore
     
+    def cachedEvaluation(self, gameState: GameState) -> float:
+        if self.evaluationCache is None:
+            return self.evaluationFunction(gameState)
+        value = self.evaluationCache.lookup(gameState.hash)
+        if value is None:
+            value = self.evaluationFunction(gameState)
+            self.evaluationCache.store(gameState.hash, value)
+        return value
+
     def moveTieBreaker(self, moves: List[str], gameState: GameState) -> Optional[str]:
         return random.choice(moves)
     
+    def selectOpponents(self, gameState: GameState) -> None:
+        "Picks the opponents that are searched as minimizers, the others play defaultOpponentMove"
+        self.searchedOpponents = None
+        self.opponentsKey = 0
+
+        if self.searchMode == SearchModes.PARANOID or gameState.players[0].head is None:
+            return
+
+        x, y = gameState.players[0].head
+        distances = {}
+        for i in range(1, len(gameState.players)):
+            player = gameState.players[i]
+            if player.alive and player.head is not None:
+                distances[i] = abs(player.head[0] - x) + abs(player.head[1] - y)
+
+        if self.searchMode == SearchModes.NEAREST_THREAT:
+            self.searchedOpponents = set([min(distances, key=distances.get)]) if len(distances) > 0 else set()
+        elif self.searchMode == SearchModes.RADIUS:
+            self.searchedOpponents = set([i for i in distances if distances[i] <= self.threatRadius])
+        else:
+            raise RuntimeError(f"Unknown search mode {self.searchMode}")
+
+        for i in range(1, len(gameState.players)):
+            if i not in self.searchedOpponents:
+                self.opponentsKey = self.opponentsKey ^ gameState.zobrist.defaultPolicy[i]
+
+    def opponentMoves(self, gameState: GameState, index: int, legalMoves: List[str]) -> List[str]:
+        if self.searchedOpponents is None or index in self.searchedOpponents:
+            return legalMoves
+        return [self.defaultOpponentMove(gameState, index, legalMoves)]
+
+    def defaultOpponentMove(self, gameState: GameState, index: int, legalMoves: List[str]) -> str:
+        "Cheap policy for opponents that are not searched: keep going straight if possible"
+        player = gameState.players[index]
+        if len(player.body) > 1:
+            (x, y), (neckx, necky) = player.body[0], player.body[1]
+            dx, dy = x - neckx, y - necky
+            # moves across the edge of wrapped boards
+            dx = -1 if dx > 1 else (1 if dx < -1 else dx)
+            dy = -1 if dy > 1 else (1 if dy < -1 else dy)
+            heading = Actions.vectorToDirection((dx, dy))
+            if heading in legalMoves:
+                return heading
+        return legalMoves[0]
+
     def getNextIndex(self, curIndex: int, gameState: GameState) -> int:
         # cycle over agents
         return (curIndex + 1) % len(gameState.players)
@@ -133,7 +229,28 @@ class MinimaxAgent(Agent):
         # reduce depth on last agent, else same depth
         return (curDepth - 1) if curIndex == (len(gameState.players) - 1) else curDepth
     
+class SearchTimeout(Exception):
+    "Raised from inside the search once its deadline has passed"
+    pass
+
 class AlphaBetaAgent(MinimaxAgent):
+    # evaluate the leaves below each frontier node in one batch, see prefetchLeaves
+    BATCH_LEAVES = False
+
+    def __init__(self, depth: int, transpositionTableSize: int = TranspositionTable.DEFAULT_SIZE, moveOrdering: Optional[MoveOrdering] = None, searchMode: str = SearchModes.PARANOID, threatRadius: int = MinimaxAgent.THREAT_RADIUS) -> None:
+        super().__init__(depth, searchMode, threatRadius)
+        # positions are memoized across searches, a size of 0 disables the table
+        self.transpositions = TranspositionTable(transpositionTableSize) if transpositionTableSize > 0 else None
+        # pass MoveOrdering() to search in the fixed direction order
+        self.moveOrdering = moveOrdering if moveOrdering is not None else HeuristicMoveOrdering()
+        # best root move of the last completed search, tried first by the next one
+        self.rootMove = None
+        self.nodes = 0
+        # wall clock time (time.perf_counter) at which vpruned raises SearchTimeout
+        self.deadline = None
+        # leaf values by position hash, filled by prefetchLeaves during a search
+        self.leafValues: Dict[int, float] = {}
+
     def getAction(self, gameState: GameState) -> Optional[str]:
         # print(f"Game state: {gameState}")
         players = gameState.players
@@ -142,6 +259,12 @@ class AlphaBetaAgent(MinimaxAgent):
             # our player is not alive
             return None
 
+        self.nodes = 0
+        self.leafValues = {}
+        self.moveOrdering.newSearch()
+        self.selectOpponents(gameState)
+        # the state may have been changed in place outside of makeMove
+        gameState.rehash()
         (bestValue, bestMove) = self.vpruned(gameState, 0, self.depth, None, None)
 
         if bestMove is None:
@@ -155,8 +278,32 @@ class AlphaBetaAgent(MinimaxAgent):
         return bestMove
     
     def vpruned(self, gameState: GameState, index: int, depth: int, alpha: Optional[float], beta: Optional[float]) -> Tuple[float, Optional[str]]:
+        self.nodes = self.nodes + 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
         if depth == 0 or gameState.isEndState() or len(gameState.players) <= 1:
-            return (self.evaluationFunction(gameState), None)
+            return (self.leafValue(gameState), None)
+
+        isRoot = index == 0 and depth == self.depth
+        ply = (self.depth - depth) * len(gameState.players) + index
+        pvMove = self.rootMove if isRoot else None
+        key = None
+        if self.transpositions is not None:
+            key = gameState.hash ^ gameState.zobrist.toMove[index] ^ self.opponentsKey
+            entry = self.transpositions.lookup(key)
+            if entry is not None:
+                _, entryDepth, value, bound, move = entry
+                pvMove = move if move is not None else pvMove
+                # the root is always searched so that ties are broken among all the best moves
+                if entryDepth >= depth and not isRoot:
+                    if bound == TranspositionTable.EXACT or (bound == TranspositionTable.LOWER and beta is not None and value >= beta) or (bound == TranspositionTable.UPPER and alpha is not None and value <= alpha):
+                        return (value, move)
+            windowAlpha, windowBeta = alpha, beta
+
+        # all the children of the last player of the last round are leaves
+        if self.BATCH_LEAVES and depth == 1 and self.getNextDepth(index, depth, gameState) == 0:
+            self.prefetchLeaves(gameState, index, depth)
         
         if index == 0:
             # Our move (maximizing)
@@ -167,8 +314,10 @@ class AlphaBetaAgent(MinimaxAgent):
             bestValue = None
             bestMoves = []
 
-            for move in legalMoves:
-                value = self.vpruned(gameState.generateSuccessor(move, 0), 1, depth, alpha, beta)[0]
+            for move in self.moveOrdering.orderMoves(gameState, 0, ply, legalMoves, pvMove):
+                undo = gameState.makeMove(move, 0, False)
+                value = self.vpruned(gameState, 1, depth, alpha, beta)[0]
+                gameState.unmakeMove(undo)
 
                 if bestValue is None or value > bestValue:
                     bestValue = value
@@ -178,12 +327,19 @@ class AlphaBetaAgent(MinimaxAgent):
                 if alpha is None or value > alpha:
                     alpha = value
                 if beta is not None and beta <= alpha:
+                    self.moveOrdering.recordCutoff(0, ply, move, depth)
                     break
 
             # if depth != self.depth:
             #     print(f"vminimax at depth {depth}, index {index}: {(bestValue, bestMoves[0])}")
+
+            bestMove = self.moveTieBreaker(bestMoves, gameState) if isRoot and len(bestMoves) > 1 else bestMoves[0]
+            if isRoot:
+                self.rootMove = bestMove
+            if key is not None:
+                self.storeTransposition(key, depth, bestValue, bestMove, windowAlpha, windowBeta)
             
-            return (bestValue, self.moveTieBreaker(bestMoves, gameState) if depth == self.depth and len(bestMoves) > 1 else bestMoves[0])
+            return (bestValue, bestMove)
         
         else:
             # Opponent's move (minimizing)
@@ -191,34 +347,403 @@ class AlphaBetaAgent(MinimaxAgent):
             
             if (len(legalMoves) == 0) or not gameState.players[index].alive:
                 # go to the next agent
-                return self.vpruned(gameState.generateSuccessor(None, index), self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState), alpha, beta)
+                undo = gameState.makeMove(None, index)
+                result = self.vpruned(gameState, self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState), alpha, beta)
+                gameState.unmakeMove(undo)
+                return result
             
             bestValue = None
             bestMove = None
 
-            for move in legalMoves:
-                value = self.vpruned(gameState.generateSuccessor(move, index), self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState), alpha, beta)[0]
+            for move in self.moveOrdering.orderMoves(gameState, index, ply, self.opponentMoves(gameState, index, legalMoves), pvMove):
+                undo = gameState.makeMove(move, index, False)
+                value = self.vpruned(gameState, self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState), alpha, beta)[0]
+                gameState.unmakeMove(undo)
                 if bestValue is None or value < bestValue:
                       bestValue = value
                       bestMove = move
                 if beta is None or value < beta:
                     beta = value
                 if alpha is not None and beta <= alpha:
+                    self.moveOrdering.recordCutoff(index, ply, move, depth)
                     break
 
             # print(f"vminimax at depth {depth}, index {index}: {(bestValue, bestMoves[0])}")
 
+            if key is not None:
+                self.storeTransposition(key, depth, bestValue, bestMove, windowAlpha, windowBeta)
+
             return (bestValue, bestMove)
+
+    def storeTransposition(self, key: int, depth: int, value: float, move: Optional[str], alpha: Optional[float], beta: Optional[float]) -> None:
+        # the bound type follows from where the value fell relative to the window the node was searched with
+        if alpha is not None and value <= alpha:
+            bound = TranspositionTable.UPPER
+        elif beta is not None and value >= beta:
+            bound = TranspositionTable.LOWER
+        else:
+            bound = TranspositionTable.EXACT
+        self.transpositions.store(key, depth, value, bound, move)
+
+    def leafValue(self, gameState: GameState) -> float:
+        value = self.leafValues.get(gameState.hash)
+        return value if value is not None else self.cachedEvaluation(gameState)
+
+    def prefetchLeaves(self, gameState: GameState, index: int, depth: int) -> None:
+        """
+        Evaluates all the leaves below this node with one evaluateLeafBatch call
+        before the node is searched. Leaves that end up pruned are evaluated too,
+        which pays off when a batch costs about as much as a single leaf. Checks
+        the deadline like vpruned, the walk and the batch can take a while.
+        """
+        leaves: Dict[int, Any] = {}
+
+        def collect(gameState: GameState, index: int, depth: int) -> None:
+            # walks the tree the way vpruned does, without pruning
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if depth == 0 or gameState.isEndState() or len(gameState.players) <= 1:
+                key = gameState.hash
+                if key not in self.leafValues and key not in leaves:
+                    value = self.evaluationCache.lookup(key) if self.evaluationCache is not None else None
+                    if value is not None:
+                        self.leafValues[key] = value
+                    else:
+                        leaves[key] = self.leafFeatures(gameState)
+                return
+
+            legalMoves = gameState.getLegalActions(index)
+            if index == 0:
+                moves = legalMoves
+            elif len(legalMoves) == 0 or not gameState.players[index].alive:
+                moves = [None]
+            else:
+                moves = self.opponentMoves(gameState, index, legalMoves)
+
+            for move in moves:
+                undo = gameState.makeMove(move, index, index != 0 and move is None)
+                collect(gameState, self.getNextIndex(index, gameState), self.getNextDepth(index, depth, gameState))
+                gameState.unmakeMove(undo)
+
+        collect(gameState, index, depth)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if len(leaves) > 0:
+            for key, value in zip(leaves.keys(), self.evaluateLeafBatch(list(leaves.values()))):
+                self.leafValues[key] = value
+                if self.evaluationCache is not None:
+                    self.evaluationCache.store(key, value)
+
+    def leafFeatures(self, gameState: GameState) -> Any:
+        "What evaluateLeafBatch needs of a leaf, taken before the search moves on from it"
+        return gameState.deepCopy()
+
+    def evaluateLeafBatch(self, features: List[Any]) -> List[float]:
+        return [self.evaluationFunction(leaf) for leaf in features]
         
+class IterativeDeepeningAgent(AlphaBetaAgent):
+    """
+    Searches with vpruned at depth 1, 2, ... until the time budget (in seconds)
+    runs out and plays the best move of the deepest completed iteration.
+    """
+    def __init__(self, timeBudget: float, maxDepth: int = 32, transpositionTableSize: int = TranspositionTable.DEFAULT_SIZE, moveOrdering: Optional[MoveOrdering] = None, searchMode: str = SearchModes.PARANOID, threatRadius: int = MinimaxAgent.THREAT_RADIUS) -> None:
+        super().__init__(1, transpositionTableSize, moveOrdering, searchMode, threatRadius)
+        self.timeBudget = timeBudget
+        self.maxDepth = maxDepth
+        self.depthReached = 0
+        # of the last evaluateMove: the value of every completed depth, and whether the last one decided the game
+        self.depthValues: List[float] = []
+        self.decided = False
+
+    def getAction(self, gameState: GameState) -> Optional[str]:
+        players = gameState.players
+
+        if not players[0].ours:
+            # our player is not alive
+            return None
+
+        self.nodes = 0
+        self.depthReached = 0
+        self.leafValues = {}
+        self.moveOrdering.newSearch()
+        self.selectOpponents(gameState)
+        self.deadline = time.perf_counter() + self.timeBudget
+        bestMove = None
+
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                self.depth = depth
+                # an aborted iteration leaves its moves applied, so search on a copy
+                (bestValue, move) = self.vpruned(gameState.deepCopy(), 0, depth, None, None)
+                bestMove = move
+                self.depthReached = depth
+
+                if move is None or abs(bestValue) >= MinimaxAgent.WIN_REWARD:
+                    # the outcome is decided, searching deeper won't change it
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+
+        if bestMove is None:
+            # certain death or not even the first iteration completed
+            legalMoves = gameState.getLegalActions()
+            if len(legalMoves) > 0:
+                return self.moveTieBreaker(legalMoves, gameState)
+
+        return bestMove
+
+    def evaluateMove(self, gameState: GameState, move: str) -> Optional[float]:
+        "Value of playing move at the root, deepened until the time budget runs out. None if no iteration completed"
+        self.nodes = 0
+        self.depthReached = 0
+        self.depthValues = []
+        self.decided = False
+        self.leafValues = {}
+        self.moveOrdering.newSearch()
+        self.selectOpponents(gameState)
+        self.deadline = time.perf_counter() + self.timeBudget
+        value = None
+
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                self.depth = depth
+                searchState = gameState.deepCopy()
+                searchState.makeMove(move, 0, False)
+                # continue with the opponents' replies
+                value = self.vpruned(searchState, 1, depth, None, None)[0]
+                self.depthReached = depth
+                self.depthValues.append(value)
+
+                if searchState.isEndState() or abs(value) >= MinimaxAgent.WIN_REWARD:
+                    # deeper searches would return the same value
+                    self.decided = True
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+
+        return value
+
+def randomRolloutMove(gameState: GameState, index: int) -> Optional[str]:
+    "Rollout policy playing any direction that stays on the board"
+    x, y = gameState.players[index].head
+    moves = list(gameState.ruleset.moveTable(gameState.width, gameState.height)[y * gameState.width + x])
+    return random.choice(moves) if len(moves) > 0 else None
+
+def safeRolloutMove(gameState: GameState, index: int) -> Optional[str]:
+    "Rollout policy playing a random legal move, like RandomEnemyAgent"
+    legalMoves = gameState.getLegalActions(index)
+    return random.choice(legalMoves) if len(legalMoves) > 0 else None
+
+class MCTSNode:
+    """
+    Decoupled UCT node: every player keeps its own visit counts and reward sums
+    per action and picks its action without seeing the others' choices.
+    Children are keyed by the joint action indexes packed into an int.
+    """
+    __slots__ = ('actions', 'visits', 'totals', 'count', 'children')
+
+    def __init__(self, actions: List[List[Optional[str]]]) -> None:
+        self.actions = actions
+        self.visits = [[0] * len(playerActions) for playerActions in actions]
+        self.totals = [[0.0] * len(playerActions) for playerActions in actions]
+        self.count = 0
+        self.children = {}
+
+    def select(self, exploration: float) -> List[int]:
+        logCount = math.log(self.count) if self.count > 0 else 0.0
+        joint = []
+        for visits, totals in zip(self.visits, self.totals):
+            best = 0
+            bestScore = None
+            for a in range(len(visits)):
+                if visits[a] == 0:
+                    best = a
+                    break
+                score = totals[a] / visits[a] + exploration * math.sqrt(logCount / visits[a])
+                if bestScore is None or score > bestScore:
+                    best = a
+                    bestScore = score
+            joint.append(best)
+        return joint
+
+    def update(self, joint: List[int], rewards: List[float]) -> None:
+        self.count = self.count + 1
+        for i in range(len(joint)):
+            self.visits[i][joint[i]] = self.visits[i][joint[i]] + 1
+            self.totals[i][joint[i]] = self.totals[i][joint[i]] + rewards[i]
+
+    def jointKey(joint: List[int]) -> int:
+        key = 0
+        for a in joint:
+            key = key * 4 + a
+        return key
+    jointKey = staticmethod(jointKey)
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search over simultaneous moves. Each iteration picks a joint
+    action per node with decoupled UCT, plays it with GameState.makeJointMove so
+    all the players move at once, expands one node and scores it with a rollout.
+    """
+    EXPLORATION = math.sqrt(2)
+    ROLLOUT_DEPTH = 20
+
+    def __init__(self, timeBudget: float, rolloutPolicy: Callable[[GameState, int], Optional[str]] = safeRolloutMove, rolloutDepth: int = ROLLOUT_DEPTH, exploration: float = EXPLORATION, maxPlayouts: Optional[int] = None) -> None:
+        self.timeBudget = timeBudget
+        self.rolloutPolicy = rolloutPolicy
+        self.rolloutDepth = rolloutDepth
+        self.exploration = exploration
+        self.maxPlayouts = maxPlayouts
+        self.root = None
+        self.playouts = 0
+        # continue from the subtree of the moves actually played when the agent is kept for a game
+        self.reuseTree = False
+        self.previousState: Optional[GameState] = None
+        # playouts the root already had from the previous turns
+        self.reusedPlayouts = 0
+
+    def getAction(self, gameState: GameState) -> Optional[str]:
+        if not gameState.players[0].ours:
+            # our player is not alive
+            return None
+
+        deadline = time.perf_counter() + self.timeBudget
+        if not (self.reuseTree and self.reuseSubtree(gameState)):
+            self.root = MCTSNode(self.nodeActions(gameState))
+        self.previousState = gameState.deepCopy() if self.reuseTree else None
+        self.reusedPlayouts = self.root.count
+        self.playouts = 0
+
+        while time.perf_counter() < deadline and (self.maxPlayouts is None or self.playouts < self.maxPlayouts):
+            self.playout(self.root, gameState)
+            self.playouts = self.playouts + 1
+
+        visits = self.root.visits[0]
+        bestMove = self.root.actions[0][visits.index(max(visits))]
+
+        if bestMove is None:
+            # certain death
+            legalMoves = gameState.getLegalActions()
+            if len(legalMoves) > 0:
+                return random.choice(legalMoves)
+
+        return bestMove
+
+    def reuseSubtree(self, gameState: GameState) -> bool:
+        "Makes the child of the last root for the moves every player actually made the root, if the tree has it"
+        previous = self.previousState
+        if self.root is None or previous is None or [p.id for p in previous.players] != [p.id for p in gameState.players]:
+            return False
+
+        joint = []
+        for i in range(len(gameState.players)):
+            before, after = previous.players[i], gameState.players[i]
+            move = MCTSAgent.movedDirection(before.head, after.head, gameState.width, gameState.height) if before.alive and after.head is not None else None
+            if move not in self.root.actions[i]:
+                return False
+            joint.append(self.root.actions[i].index(move))
+
+        child = self.root.children.get(MCTSNode.jointKey(joint))
+        # the simulated moves must have led to a position with the same choices, food spawns don't change them
+        if child is None or child.actions != self.nodeActions(gameState):
+            return False
+        self.root = child
+        return True
+
+    def movedDirection(before: Tuple[int, int], after: Tuple[int, int], width: int, height: int) -> Optional[str]:
+        dx, dy = (after[0] - before[0]) % width, (after[1] - before[1]) % height
+        # moves across the edge of wrapped boards
+        dx = dx - width if dx > 1 else dx
+        dy = dy - height if dy > 1 else dy
+        return Actions.vectorToDirection((dx, dy)) if abs(dx) + abs(dy) == 1 else None
+    movedDirection = staticmethod(movedDirection)
+
+    def nodeActions(self, gameState: GameState) -> List[List[Optional[str]]]:
+        "Moves considered for each player: on the board and not into a body, regardless of the others' moves"
+        walls = gameState.getWallMask()
+        width = gameState.width
+        moveTable = gameState.ruleset.moveTable(width, gameState.height)
+        actions = []
+        for player in gameState.players:
+            moves = []
+            if player.alive:
+                x, y = player.head
+                for direction, cell in moveTable[y * width + x].items():
+                    if not (walls >> cell) & 1:
+                        moves.append(direction)
+            actions.append(moves if len(moves) > 0 else [None])
+        return actions
+
+    def applyJointMove(self, gameState: GameState, moves: List[Optional[str]], undos: List[Tuple]) -> None:
+        # resolved simultaneously, so equal health snakes meeting head on both die instead of the later mover
+        undos.append(gameState.makeJointMove(moves))
+
+    def playout(self, root: MCTSNode, gameState: GameState) -> None:
+        path = []
+        undos = []
+        node = root
+
+        # selection and expansion
+        while not gameState.isEndState():
+            joint = node.select(self.exploration)
+            path.append((node, joint))
+            self.applyJointMove(gameState, [node.actions[i][joint[i]] for i in range(len(joint))], undos)
+            if gameState.isEndState():
+                break
+            key = MCTSNode.jointKey(joint)
+            child = node.children.get(key)
+            if child is None:
+                node.children[key] = MCTSNode(self.nodeActions(gameState))
+                break
+            node = child
+
+        rewards = self.rollout(gameState)
+
+        for undo in reversed(undos):
+            gameState.unmakeJointMove(undo)
+
+        for node, joint in path:
+            node.update(joint, rewards)
+
+    def rollout(self, gameState: GameState) -> List[float]:
+        undos = []
+        for _ in range(self.rolloutDepth):
+            if gameState.isEndState():
+                break
+            # no decisions are made here, so each player sees the moves of the players before it like in Trainer
+            for i in range(len(gameState.players)):
+                if gameState.isEndState():
+                    break
+                if gameState.players[i].alive:
+                    # safe rollout moves come from getLegalActions, so they don't need checking again
+                    undos.append(gameState.makeMove(self.rolloutPolicy(gameState, i), i, self.rolloutPolicy is not safeRolloutMove))
+
+        rewards = self.rewards(gameState)
+
+        for undo in reversed(undos):
+            gameState.unmakeMove(undo)
+
+        return rewards
+
+    def rewards(self, gameState: GameState) -> List[float]:
+        "Survivors share the reward, dead players get nothing"
+        alive = len(gameState.getAlivePlayers())
+        return [1.0 / alive if player.alive else 0.0 for player in gameState.players]
+
 class CustomEncoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:
         if(isinstance(o, GameState) or isinstance(o, Player)):
-            return o.__dict__
+            return {key: o.__dict__[key] for key in o.FIELDS}
         return super().default(o)
         
 class QLearningAgent(Agent):
-    def __init__(self) -> None:
-        self.model = SnakeInference()
+    def __init__(self, model: Optional[SnakeInference] = None) -> None:
+        # pass a ScriptedSnakeInference to run the exported TorchScript model
+        self.model = model if model is not None else SnakeInference()
 
     def getAction(self, gameState: GameState) -> Optional[str]:
         # print(f"Game state: {gameState}")
@@ -227,20 +752,30 @@ class QLearningAgent(Agent):
         if len(legalMoves) == 0:
             return None
 
-        values = [(self.model.value(json.loads(json.dumps({'gameState': gameState, 'action': move}, indent=4, cls=CustomEncoder))), move) for move in legalMoves]
+        values = list(zip(self.model.state_values(gameState, legalMoves), legalMoves))
         print(values)
         return max(values)[1]
 
 class QLearningAlphaBetaAgent(AlphaBetaAgent):
-    def __init__(self, depth: int) -> None:
+    BATCH_LEAVES = True
+
+    def __init__(self, depth: int, model: Optional[SnakeInference] = None) -> None:
         super().__init__(depth)
-        self.model = SnakeInference()
+        self.model = model if model is not None else SnakeInference()
 
     def evaluationFunction(self, gameState: GameState) -> float:
-        legalMoves = gameState.getLegalActions()
-
-        if len(legalMoves) == 0:
-            return 0.0
-
-        values = [self.model.value(json.loads(json.dumps({'gameState': gameState, 'action': move}, indent=4, cls=CustomEncoder))) for move in legalMoves]
-        return max(values)
\ No newline at end of file
+        return self.evaluateLeafBatch([self.leafFeatures(gameState)])[0]
+
+    def leafFeatures(self, gameState: GameState) -> Any:
+        # the model input of each legal move, encoded while the leaf is on the board
+        return BoardEncoder.encode_actions(gameState, gameState.getLegalActions())
+
+    def evaluateLeafBatch(self, features: List[Any]) -> List[float]:
+        # the boards of all the leaves go through the model together
+        values = self.model.board_values(np.concatenate(features))
+        result = []
+        start = 0
+        for boards in features:
+            result.append(float(max(values[start:start + len(boards)])) if len(boards) > 0 else 0.0)
+            start = start + len(boards)
+        return result
\ No newline at end of file
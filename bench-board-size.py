@@ -0,0 +1,32 @@
+import random
+import statistics
+import time
+import torch
+from cnn_inference import BoardEncoder, load_model
+from train import GameSimulator
+
+def median(model, boards, calls: int = 200) -> float:
+    times = []
+    with torch.inference_mode():
+        for i in range(calls):
+            start = time.perf_counter()
+            model(boards)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+random.seed(0)
+torch.manual_seed(0)
+torch.set_num_threads(1)
+# untrained weights, the timings don't depend on them
+padded = load_model(None)
+pooled = load_model(None, True)
+print(f"weights: padded {sum(p.numel() for p in padded.parameters())}, pooled {sum(p.numel() for p in pooled.parameters())}")
+
+for size in [7, 11, 19]:
+    states = GameSimulator.getRandomPositions(size, size, 3, 16, 3 * size)
+    for batchSize in [1, 3, 16]:
+        paddedBoards = torch.from_numpy(BoardEncoder.encode_batch([{'gameState': state, 'action': 'up'} for state in states[:batchSize]]))
+        nativeBoards = torch.from_numpy(BoardEncoder.encode_batch([{'gameState': state, 'action': 'up'} for state in states[:batchSize]], True))
+        paddedTime = median(padded, paddedBoards)
+        pooledTime = median(pooled, nativeBoards)
+        print(f"{size}x{size} batch {batchSize}: padded 32x32 {paddedTime * 1e3:.2f}ms, native {size}x{size} {pooledTime * 1e3:.2f}ms, speedup {paddedTime / pooledTime:.1f}x")
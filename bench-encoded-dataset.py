@@ -0,0 +1,66 @@
+import os
+import random
+import sys
+import tempfile
+import time
+import torch
+from cnn_dataset import EncodedDataset, preprocess_dataset
+from cnn_inference import BoardEncoder, load_model
+from cnn_training import NEXT_ACTIONS, next_action_boards, train_encoded_model, train_model
+from dataset import loadDataset
+
+# bench-encoded-dataset.py [dataset.json] [epochs], any JSON or binary dataset of dump-dataset.py
+
+def recordsEpoch(examples, native: bool, batchSize: int = 64) -> float:
+    "Seconds to build the input and TD target boards of every batch, the way train_model does"
+    start = time.perf_counter()
+    random.shuffle(examples)
+    # native boards of different sizes can't share a batch
+    groups = {}
+    for example in examples:
+        groups.setdefault(BoardEncoder.board_size(example['gameState'], native), []).append(example)
+    batches = [group[first:first + batchSize] for group in groups.values() for first in range(0, len(group), batchSize)]
+    for batch in batches:
+        torch.from_numpy(BoardEncoder.encode_batch(batch, native))
+        for example in batch:
+            BoardEncoder.encode_actions(example['nextState'], NEXT_ACTIONS, native)
+    return time.perf_counter() - start
+
+def encodedEpoch(dataset: EncodedDataset) -> float:
+    "Seconds for the same boards from the mapped arrays, in a random batch order"
+    start = time.perf_counter()
+    for index in torch.randperm(len(dataset)).tolist():
+        boards, nextStates, _, _ = dataset[index]
+        boards.float()
+        next_action_boards(nextStates)
+    return time.perf_counter() - start
+
+datasetPath = sys.argv[1] if len(sys.argv) > 1 else 'dataset.json'
+epochs = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+torch.manual_seed(0)
+torch.set_num_threads(1)
+examples = loadDataset(datasetPath)
+print(f"{len(examples)} records")
+
+with tempfile.TemporaryDirectory() as directory:
+    for native in [False, True]:
+        encoded = os.path.join(directory, 'native' if native else 'padded')
+        start = time.perf_counter()
+        preprocess_dataset(datasetPath, encoded, native)
+        size = sum(os.path.getsize(os.path.join(encoded, name)) for name in os.listdir(encoded))
+        print(f"{'native' if native else 'padded'}: preprocessed in {time.perf_counter() - start:.2f}s, {size / (1 << 20):.1f}MB on disk")
+
+        dataset = EncodedDataset(encoded, cache_megabytes=16)
+        recordsTime = min(recordsEpoch(examples, native) for _ in range(epochs))
+        encodedTime = min(encodedEpoch(dataset) for _ in range(epochs))
+        print(f"  batches of an epoch: records {recordsTime:.2f}s, encoded {encodedTime:.2f}s, speedup {recordsTime / encodedTime:.1f}x")
+
+        model = load_model(None, native)
+        start = time.perf_counter()
+        train_model(model, examples, epochs, native)
+        recordsTime = (time.perf_counter() - start) / epochs
+        model = load_model(None, native)
+        start = time.perf_counter()
+        train_encoded_model(model, dataset, epochs)
+        encodedTime = (time.perf_counter() - start) / epochs
+        print(f"  training epoch: records {recordsTime:.2f}s, encoded {encodedTime:.2f}s, speedup {recordsTime / encodedTime:.1f}x")
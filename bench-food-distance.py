@@ -0,0 +1,79 @@
+import random
+import sys
+import time
+from typing import List, Tuple
+import agents
+from agents import MinimaxAgent
+from search import Queue, minDistanceToFoodBfs, minDistanceToFoodBfsWithQueue, foodDistancesBfs
+from train import GameSimulator
+
+# bench-food-distance.py, checks the food distances of the grid BFS against the list based BFS the agents started out with
+# and the queue BFS on bitboards that replaced it, then times the three and the leaf evaluations of the last two
+
+def listBfs(startX, startY, food: List[Tuple[int, int]], walls: List[Tuple[int, int]], width: int, height: int):
+    "minDistanceToFoodBfs as the agents first had it, on the food and getWalls lists"
+    visited = [[False for _ in range(height)] for _ in range(width)]
+    queue = Queue()
+    queue.push((startX, startY, 0))
+    dpos = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+    while not queue.isEmpty():
+        x, y, dist = queue.pop()
+        visited[x][y] = True
+
+        if((x, y) in food):
+            return dist
+        
+        for dx, dy in dpos:
+            newx = x + dx
+            newy = y + dy
+
+            if newx >= 0 and newx < width and newy >= 0 and newy < height and (not visited[newx][newy]) and ((newx, newy) not in walls):
+                queue.push((newx, newy, dist + 1))
+    
+    return -1
+
+def throughput(distance, cases, rounds: int) -> float:
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for (x, y, foodMask, wallMask, width, height) in cases:
+            distance(x, y, foodMask, wallMask, width, height)
+            calls = calls + 1
+    return calls / (time.perf_counter() - start)
+
+def leafThroughput(positions, rounds: int) -> float:
+    agent = MinimaxAgent(1)
+    evaluations = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for state in positions:
+            agent.evaluationFunction(state)
+            evaluations = evaluations + 1
+    return evaluations / (time.perf_counter() - start)
+
+random.seed(0)
+failed = False
+# the list and queue BFS queue cells again on every path reaching them, which explodes on open 19x19 boards
+for size in [7, 11]:
+    positions = [state for state in GameSimulator.getRandomPositions(size, size, 3, 200, 3 * size) if state.players[0].head is not None and len(state.food) > 0]
+    cases = [(*state.players[0].head, state.getFoodMask(), state.getWallMask(), state.width, state.height) for state in positions]
+    listCases = [(*state.players[0].head, state.food, state.getWalls(), state.width, state.height) for state in positions]
+    mismatches = sum(1 for case, listCase in zip(cases, listCases) if minDistanceToFoodBfs(*case) != listBfs(*listCase))
+    mismatches = mismatches + sum(1 for case in cases if minDistanceToFoodBfs(*case) != minDistanceToFoodBfsWithQueue(*case))
+    mismatches = mismatches + sum(1 for case in cases if min(foodDistancesBfs(*case).values(), default=-1) != minDistanceToFoodBfs(*case))
+    failed = failed or mismatches > 0
+
+    lists = throughput(listBfs, listCases, 5)
+    queue = throughput(minDistanceToFoodBfsWithQueue, cases, 5)
+    grid = throughput(minDistanceToFoodBfs, cases, 20)
+    allFood = throughput(foodDistancesBfs, cases, 20)
+    agents.minDistanceToFoodBfs = minDistanceToFoodBfsWithQueue
+    queueLeaves = leafThroughput(positions, 5)
+    agents.minDistanceToFoodBfs = minDistanceToFoodBfs
+    gridLeaves = leafThroughput(positions, 20)
+    print(f"{size}x{size}: list BFS {round(lists)} calls/s, queue BFS on bitboards {round(queue)} calls/s, grid BFS {round(grid)} calls/s "
+        f"({grid / lists:.1f}x the list BFS, {grid / queue:.1f}x the queue BFS), distances to all food {round(allFood)} calls/s, "
+        f"leaf evaluations with the queue BFS {round(queueLeaves)}/s, with the grid BFS {round(gridLeaves)}/s ({gridLeaves / queueLeaves:.1f}x), mismatches {mismatches}")
+if failed:
+    sys.exit("the grid BFS distances disagree with the list or queue BFS")
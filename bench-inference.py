@@ -0,0 +1,50 @@
+import json
+import random
+import time
+import numpy as np
+import torch
+from agents import CustomEncoder, QLearningAlphaBetaAgent
+from cnn_inference import BoardEncoder, ShapedExample, SnakeInference
+from train import GameSimulator
+
+def examplesPerSecond(evaluate, examples, batchSize: int, minSeconds: float = 0.5) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < minSeconds:
+        batch = [examples[(count + i) % len(examples)] for i in range(batchSize)]
+        evaluate(batch)
+        count = count + batchSize
+    return count / (time.perf_counter() - start)
+
+def forward(model: SnakeInference, boards) -> None:
+    with torch.no_grad():
+        model.model(torch.Tensor(np.array(boards)))
+
+random.seed(0)
+torch.manual_seed(0)
+torch.set_num_threads(1)
+# untrained weights, the timings don't depend on them
+model = SnakeInference(None)
+positions = GameSimulator.getRandomPositions(11, 11, 3, 50, 30)
+# (state, action) examples the way the agents used to build them, through JSON
+examples = [{'gameState': json.loads(json.dumps(state, indent=4, cls=CustomEncoder)), 'action': move} for state in positions for move in state.getLegalActions()]
+boards = [ShapedExample(example).board_curr.get_board() for example in examples]
+
+print(f"encoding: {examplesPerSecond(lambda batch: [ShapedExample(example) for example in batch], examples, 16):.0f} examples/s")
+jsonPerSecond = examplesPerSecond(lambda batch: [BoardEncoder.encode({'gameState': json.loads(json.dumps(state, indent=4, cls=CustomEncoder)), 'action': 'up'}) for state in batch], positions, 16)
+directPerSecond = examplesPerSecond(lambda batch: [BoardEncoder.encode_actions(state, ['up']) for state in batch], positions, 16)
+print(f"GameState through JSON: {1e6 / jsonPerSecond:.1f}us per example, directly: {1e6 / directPerSecond:.1f}us per example")
+for batchSize in [1, 2, 4, 8, 16, 32, 64, 128, 256]:
+    encoded = examplesPerSecond(model.values, examples, batchSize)
+    forwardOnly = examplesPerSecond(lambda batch: forward(model, batch), boards, batchSize)
+    print(f"batch {batchSize}: {encoded:.0f} leaf evaluations/s, forward pass only {forwardOnly:.0f}/s")
+
+for batchLeaves in [False, True]:
+    agent = QLearningAlphaBetaAgent(2, model)
+    agent.BATCH_LEAVES = batchLeaves
+    nodes = 0
+    start = time.perf_counter()
+    for state in positions[:4]:
+        agent.getAction(state.deepCopy())
+        nodes = nodes + agent.nodes
+    print(f"alpha-beta depth 2, {'batched' if batchLeaves else 'one by one'}: {nodes} nodes in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,21 @@
+import random
+import time
+from game import Actions
+from train import GameSimulator
+
+def throughput(legalMoves, positions, rounds: int) -> float:
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for state in positions:
+            for index in range(len(state.players)):
+                legalMoves(state.players, state.width, state.height, index)
+                calls = calls + 1
+    return calls / (time.perf_counter() - start)
+
+random.seed(0)
+for size in [11, 19]:
+    positions = GameSimulator.getRandomPositions(size, size, 3, 200, 4 * size)
+    lists = throughput(Actions.getPossibleActionsFromLists, positions, 20)
+    bitboards = throughput(Actions.getPossibleActions, positions, 20)
+    print(f"{size}x{size}: lists {round(lists)} calls/s, bitboards {round(bitboards)} calls/s, speedup {bitboards / lists:.2f}x")
@@ -0,0 +1,145 @@
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+from game import Actions, GameState
+from train import GameSimulator
+
+# bench-make-unmake.py, checks makeMove/unmakeMove against generateSuccessor and makeJointMove/unmakeJointMove on random GameSimulator playouts, then times make/unmake
+
+def snapshot(gameState: GameState) -> Tuple:
+    "Everything makeMove changes, including the bitboards and the hash, which __eq__ leaves out"
+    players = tuple([(player.id, player.health, tuple(player.body), player.head, player.length, player.alive, player.ours, player.bodyMask, player.stacked) for player in gameState.players])
+    return (tuple(gameState.food), tuple(gameState.hazards), players, gameState.endState, gameState.won, gameState.lost, gameState.tie, gameState.hash)
+
+def randomAction(gameState: GameState, index: int) -> Optional[str]:
+    # mostly legal moves, sometimes an illegal one or none, so the eliminations get checked too
+    legalMoves = gameState.getLegalActions(index)
+    if len(legalMoves) > 0 and random.random() < 0.9:
+        return random.choice(legalMoves)
+    return random.choice([direction for direction, _ in Actions._directionsAsList] + [None])
+
+def parityCheck(games: int, numEnemies: int, size: int, seed: int) -> Tuple[int, int, int]:
+    """
+    Plays random games in place and checks every move: the state after
+    makeMove equals generateSuccessor's and survives GameState.encode and
+    decode, unmakeMove restores the exact snapshot, and the incremental hash
+    equals a full rehash. Returns the
+    number of moves checked, of those from or to a state with a stacked body,
+    and of mismatches.
+
+    ensureMinimumFood can spawn food under a body, and a snake eating it on
+    its own tail keeps the tail, so two segments share a cell. Those states
+    are counted apart, they are the ones deepCopy and decode have to carry
+    over with restoreStackedBodies.
+    """
+    random.seed(seed)
+    moves = stackedMoves = mismatches = 0
+    for _ in range(games):
+        gameState = GameSimulator.getRandomGameState(size, size, numEnemies)
+        for _ in range(size * size * 2):
+            if gameState.isEndState():
+                break
+            for index in range(len(gameState.players)):
+                if gameState.isEndState():
+                    break
+                action = randomAction(gameState, index)
+                before = snapshot(gameState)
+                expected = gameState.generateSuccessor(action, index)
+
+                undo = gameState.makeMove(action, index)
+                moves = moves + 1
+                if any(player.stacked > 0 for player in gameState.players) or any(player[-1] > 0 for player in before[2]):
+                    stackedMoves = stackedMoves + 1
+                after = snapshot(gameState)
+                same = after == snapshot(expected) and gameState == expected and gameState.hash == gameState.zobrist.hashState(gameState)
+                # the form states are shipped to SearchPool's workers in
+                same = same and snapshot(GameState.decode(gameState.encode()))[:3] == after[:3]
+
+                gameState.unmakeMove(undo)
+                if not same or snapshot(gameState) != before:
+                    mismatches = mismatches + 1
+                # carry on in place with the move that was checked
+                gameState.makeMove(action, index)
+            GameSimulator.ensureMinimumFood(gameState)
+    return (moves, stackedMoves, mismatches)
+
+def headOnState(health: int, otherHealth: int) -> GameState:
+    "Two snakes two cells apart on one row, moving right and left meets them head on"
+    return GameState({
+        'board': {'width': 7, 'height': 7, 'food': [], 'hazards': [], 'snakes': [
+            {'health': health, 'body': [{'x': 2, 'y': 3}, {'x': 1, 'y': 3}, {'x': 0, 'y': 3}], 'id': 1},
+            {'health': otherHealth, 'body': [{'x': 4, 'y': 3}, {'x': 5, 'y': 3}, {'x': 6, 'y': 3}], 'id': 2},
+        ]},
+        'you': {'id': 1}
+    })
+
+def jointMoveCheck(games: int, numEnemies: int, size: int, seed: int) -> int:
+    """
+    Mismatches of makeJointMove: head on collisions kill the snake with less
+    health and both with equal health, whatever the player order, and on
+    random playouts unmakeJointMove restores the exact snapshot and the hash
+    equals a full rehash.
+    """
+    mismatches = 0
+    for health, otherHealth, alive in [(50, 50, [False, False]), (60, 50, [True, False]), (50, 60, [False, True])]:
+        gameState = headOnState(health, otherHealth)
+        before = snapshot(gameState)
+        undo = gameState.makeJointMove(['right', 'left'])
+        if [player.alive for player in gameState.players] != alive or gameState.won != (alive == [True, False]) or gameState.tie != (alive == [False, False]):
+            mismatches = mismatches + 1
+        gameState.unmakeJointMove(undo)
+        if snapshot(gameState) != before:
+            mismatches = mismatches + 1
+
+    random.seed(seed)
+    for _ in range(games):
+        gameState = GameSimulator.getRandomGameState(size, size, numEnemies)
+        for _ in range(size * size * 2):
+            if gameState.isEndState():
+                break
+            actions = [randomAction(gameState, index) if gameState.players[index].alive else None for index in range(len(gameState.players))]
+            before = snapshot(gameState)
+            undo = gameState.makeJointMove(actions)
+            if gameState.hash != gameState.zobrist.hashState(gameState):
+                mismatches = mismatches + 1
+            after = snapshot(gameState)
+            gameState.unmakeJointMove(undo)
+            if snapshot(gameState) != before:
+                mismatches = mismatches + 1
+            gameState.makeJointMove(actions)
+            if snapshot(gameState) != after:
+                mismatches = mismatches + 1
+            GameSimulator.ensureMinimumFood(gameState)
+    return mismatches
+
+def throughput(positions: List[GameState], calls: int) -> Tuple[float, float]:
+    "Moves per second of generateSuccessor and of makeMove followed by unmakeMove"
+    actions = [(gameState, random.choice(gameState.getLegalActions(0))) for gameState in positions]
+    start = time.perf_counter()
+    for i in range(calls):
+        gameState, action = actions[i % len(actions)]
+        gameState.generateSuccessor(action, 0)
+    copying = calls / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(calls):
+        gameState, action = actions[i % len(actions)]
+        gameState.unmakeMove(gameState.makeMove(action, 0))
+    inPlace = calls / (time.perf_counter() - start)
+    return (copying, inPlace)
+
+# small boards fill up, so most of the stacked bodies come from there
+failed = False
+for size, numEnemies, games in [(7, 1, 1000), (11, 2, 200), (19, 3, 100)]:
+    moves, stackedMoves, mismatches = parityCheck(games, numEnemies, size, size)
+    jointMismatches = jointMoveCheck(games, numEnemies, size, size)
+    failed = failed or mismatches > 0 or jointMismatches > 0
+    print(f"parity {size}x{size}, {numEnemies + 1} players: {moves} moves, {stackedMoves} with a stacked body, {mismatches} mismatches")
+    print(f"joint moves {size}x{size}, {numEnemies + 1} players: {jointMismatches} mismatches")
+if failed:
+    sys.exit("makeMove/unmakeMove or makeJointMove/unmakeJointMove disagree with generateSuccessor")
+
+random.seed(0)
+for size in [7, 11, 19]:
+    copying, inPlace = throughput(GameSimulator.getRandomPositions(size, size, 2, 50, 3 * size), 20000)
+    print(f"{size}x{size}: generateSuccessor {copying:.0f} moves/s, makeMove/unmakeMove {inPlace:.0f} moves/s, speedup {inPlace / copying:.1f}x")
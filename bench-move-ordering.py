@@ -0,0 +1,27 @@
+import random
+from agents import AlphaBetaAgent, IterativeDeepeningAgent
+from ordering import HeuristicMoveOrdering, MoveOrdering
+from train import GameSimulator
+
+random.seed(0)
+positions = GameSimulator.getRandomPositions(11, 11, 1, 10, 22) + GameSimulator.getRandomPositions(11, 11, 2, 10, 22)
+
+for depth in range(2, 6):
+    fixed = 0
+    unordered = 0
+    ordered = 0
+    for position in positions:
+        # plain fixed depth search in direction order, without a transposition table
+        agent = AlphaBetaAgent(depth, 0, MoveOrdering())
+        agent.getAction(position.deepCopy())
+        fixed = fixed + agent.nodes
+
+        # iterative deepening up to the same depth, so the PV of the previous iteration is available
+        agent = IterativeDeepeningAgent(float('inf'), depth, moveOrdering=MoveOrdering())
+        agent.getAction(position.deepCopy())
+        unordered = unordered + agent.nodes
+
+        agent = IterativeDeepeningAgent(float('inf'), depth, moveOrdering=HeuristicMoveOrdering())
+        agent.getAction(position.deepCopy())
+        ordered = ordered + agent.nodes
+    print(f"depth {depth}: fixed order {fixed} nodes, deepening in fixed order {unordered} nodes, deepening with PV/killer/history ordering {ordered} nodes ({100.0 * (1 - ordered / unordered):.0f}% fewer)")
@@ -0,0 +1,85 @@
+import io
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+from cnn_inference import BoardEncoder, Quantization, ScriptedSnakeInference, calibration_boards, export_torchscript, load_model, quantize_model
+from train import GameSimulator
+
+# python bench-quantization.py [model.pth], untrained weights without one
+VARIANTS = [None, Quantization.DYNAMIC, Quantization.STATIC]
+
+def residentMB() -> float:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def examples(seed: int, count: int):
+    random.seed(seed)
+    return [{'gameState': state, 'action': move} for state in GameSimulator.getRandomPositions(11, 11, 3, count, 30) for move in state.getLegalActions()]
+
+def build(modelPath: str, quantization, calibration):
+    model = load_model(modelPath)
+    return model if quantization is None else quantize_model(model, quantization, calibration)
+
+def median(model, boards, calls: int = 200) -> float:
+    times = []
+    with torch.inference_mode():
+        for i in range(calls):
+            start = time.perf_counter()
+            model(boards)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+torch.set_num_threads(1)
+if len(sys.argv) > 2 and sys.argv[1] == '--resident':
+    # what a worker process adds by loading an exported model, in a fresh process for each variant
+    before = residentMB()
+    ScriptedSnakeInference(sys.argv[2])
+    print(residentMB() - before)
+    sys.exit(0)
+
+torch.manual_seed(0)
+modelPath = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), 'snake-model.pth')
+if len(sys.argv) <= 1:
+    torch.save(load_model(None).state_dict(), modelPath)
+
+# the positions the quantization is judged on are not the calibration positions
+test = examples(2, 100)
+calibration = calibration_boards(examples(1, 200))
+directory = tempfile.mkdtemp()
+boards = torch.from_numpy(BoardEncoder.encode_batch(test))
+moves = [example['action'] for example in test]
+with torch.inference_mode():
+    reference = load_model(modelPath)(boards).numpy()[:, 0]
+
+for quantization in VARIANTS:
+    name = quantization if quantization is not None else 'float'
+    model = build(modelPath, quantization, calibration)
+    with torch.inference_mode():
+        values = model(boards).numpy()[:, 0]
+    # the move picked for each position, the examples of a position are consecutive
+    agree = total = 0
+    start = 0
+    while start < len(test):
+        end = start + 1
+        while end < len(test) and test[end]['gameState'] is test[start]['gameState']:
+            end = end + 1
+        agree = agree + (np.argmax(values[start:end]) == np.argmax(reference[start:end]))
+        total = total + 1
+        start = end
+    weights = io.BytesIO()
+    torch.save(model.state_dict(), weights)
+    scriptedPath = os.path.join(directory, f'snake-model-{name}.pt')
+    export_torchscript(scriptedPath, modelPath, quantization, calibration)
+    resident = subprocess.run([sys.executable, __file__, '--resident', scriptedPath], capture_output=True, text=True).stdout.strip().splitlines()[-1]
+    print(f"{name}: drift max {np.abs(values - reference).max():.4f}, mean {np.abs(values - reference).mean():.4f}, same move {agree}/{total}, "
+        f"latency batch 1 {median(model, boards[:1]) * 1e3:.2f}ms, batch 16 {median(model, boards[:16]) * 1e3:.2f}ms, "
+        f"weights {weights.tell() / 2**20:.1f}MB, resident per worker {float(resident):.0f}MB")
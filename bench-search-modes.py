@@ -0,0 +1,21 @@
+import random
+from agents import IterativeDeepeningAgent, SearchModes
+from train import GameSimulator
+
+random.seed(0)
+duels = GameSimulator.getRandomPositions(11, 11, 1, 10, 22)
+fourSnakes = GameSimulator.getRandomPositions(11, 11, 3, 10, 22)
+
+for budget in [0.1, 0.3, 0.5]:
+    for name, positions, mode in [('duel', duels, SearchModes.PARANOID),
+                                  ('4 snakes', fourSnakes, SearchModes.PARANOID),
+                                  ('4 snakes', fourSnakes, SearchModes.RADIUS),
+                                  ('4 snakes', fourSnakes, SearchModes.NEAREST_THREAT)]:
+        depths = []
+        nodes = 0
+        for position in positions:
+            agent = IterativeDeepeningAgent(budget, searchMode=mode)
+            agent.getAction(position.deepCopy())
+            depths.append(agent.depthReached)
+            nodes = nodes + agent.nodes
+        print(f"{int(budget * 1000)}ms {name} {mode}: mean depth {sum(depths) / len(depths):.1f}, min depth {min(depths)}, {nodes // len(positions)} nodes per search")
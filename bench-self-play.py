@@ -0,0 +1,14 @@
+import os
+from agents import RandomEnemyAgent
+from selfplay import SelfPlay
+
+# episodes/s of dump-dataset.py's setup as the workers go up to the number of cores
+if __name__ == '__main__':
+    cores = os.cpu_count() or 1
+    baseline = None
+    for workers in sorted(set([1, 2, 4, cores])):
+        selfPlay = SelfPlay(workers)
+        selfPlay.generate(None, [RandomEnemyAgent(1), RandomEnemyAgent(2)], 20 * workers)
+        rate = selfPlay.episodes / selfPlay.elapsed
+        baseline = rate if baseline is None else baseline
+        print(f"{workers} workers on {cores} cores: {rate:.1f} episodes/s, {rate / baseline:.2f}x of 1 worker")
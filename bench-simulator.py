@@ -0,0 +1,104 @@
+import contextlib
+import io
+import random
+import time
+import numpy as np
+from agents import RandomEnemyAgent
+from game import GameRules, GameState
+from simulator import BatchSimulator
+import train
+
+def playTurn(gameState: GameState, actions) -> None:
+    "One turn of Trainer.train with the given action ids"
+    for index in range(len(gameState.players)):
+        player = gameState.players[index]
+        if not player.alive:
+            continue
+        action = BatchSimulator.DIRECTIONS[actions[index]] if actions[index] >= 0 else None
+        if action is None or action not in GameRules.getLegalActions(gameState, index):
+            player.alive = False
+        else:
+            player.move(action, gameState.width, gameState.height, gameState.food, gameState.hazards)
+    gameState.accountForEndState()
+
+def sameState(simulator: BatchSimulator, game: int, gameState: GameState) -> bool:
+    other = simulator.toGameState(game)
+    return other.players == gameState.players and sorted(other.food) == sorted(gameState.food) and \
+        (other.won, other.lost, other.tie) == (gameState.won, gameState.lost, gameState.tie)
+
+def crossCheck(games: int, numPlayers: int, size: int, seed: int) -> int:
+    """
+    Plays the same games with the simulator and with GameState, Player.move and
+    GameRules.getLegalActions, returns the number of games that diverged. Half
+    of the turns the simulator picks the moves, the other half GameState does.
+    Food spawned by the simulator is copied over.
+    """
+    random.seed(seed)
+    simulator = BatchSimulator(games, numPlayers, size, size, seed)
+    states = [simulator.toGameState(game) for game in range(games)]
+    diverged = set()
+    turn = 0
+    while not simulator.done.all():
+        running = [game for game in range(games) if not simulator.done[game] and game not in diverged]
+        turn = turn + 1
+        if turn % 2 == 0:
+            played = simulator.step()
+            for game in running:
+                playTurn(states[game], played[game])
+                # a move the simulator skipped must not have been available either
+                if any(played[game, index] == BatchSimulator.NO_MOVE and simulator.alive[game, index] for index in range(numPlayers)):
+                    diverged.add(game)
+        else:
+            actions = np.full((games, numPlayers), BatchSimulator.NO_MOVE)
+            for game in running:
+                state = states[game]
+                for index in range(numPlayers):
+                    if not state.players[index].alive:
+                        continue
+                    legalMoves = GameRules.getLegalActions(state, index)
+                    move = random.choice(legalMoves) if len(legalMoves) > 0 else None
+                    actions[game, index] = BatchSimulator.DIRECTIONS.index(move) if move is not None else BatchSimulator.NO_MOVE
+                    if move is None:
+                        state.players[index].alive = False
+                    else:
+                        state.players[index].move(move, state.width, state.height, state.food, state.hazards)
+                state.accountForEndState()
+            simulator.step(actions)
+
+        for game in running:
+            state = states[game]
+            simulated = simulator.toGameState(game)
+            # the pellets left on the board must match before taking over the simulator's new ones
+            remaining = list(state.food)
+            for cell in simulated.food:
+                if cell in remaining:
+                    remaining.remove(cell)
+            if len(remaining) > 0:
+                diverged.add(game)
+            state.food = list(simulated.food)
+            if not sameState(simulator, game, state):
+                diverged.add(game)
+    return len(diverged)
+
+def trainerThroughput(episodes: int) -> float:
+    "Games per second of dump-dataset.py's Trainer setup"
+    agent = train.DataDumpAgent()
+    trainer = train.Trainer([RandomEnemyAgent(1), RandomEnemyAgent(2)])
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        trainer.train(agent, episodes)
+    return episodes / (time.perf_counter() - start)
+
+def simulatorThroughput(games: int, seed: int) -> float:
+    simulator = BatchSimulator(games, 3, 11, 11, seed)
+    start = time.perf_counter()
+    while not simulator.done.all():
+        simulator.step()
+    return games / (time.perf_counter() - start)
+
+for size, numPlayers in [(7, 2), (11, 3), (11, 4)]:
+    print(f"cross-check {size}x{size}, {numPlayers} players: {crossCheck(200, numPlayers, size, size)} of 200 games diverged")
+
+print(f"Trainer: {trainerThroughput(20):.1f} games/s")
+for games in [1, 1000, 10000]:
+    print(f"BatchSimulator, {games} games: {simulatorThroughput(games, games):.1f} games/s")
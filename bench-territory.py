@@ -0,0 +1,101 @@
+import random
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+from agents import MinimaxAgent
+from game import GameState
+from search import voronoiTerritory
+from train import GameSimulator
+
+def leafThroughput(agent: MinimaxAgent, positions, rounds: int) -> float:
+    evaluations = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for state in positions:
+            agent.evaluationFunction(state)
+            evaluations = evaluations + 1
+    return evaluations / (time.perf_counter() - start)
+
+def referenceTerritory(gameState: GameState) -> List[int]:
+    "GridBfs.territory cell by cell on sets of coordinates, for checking the bitboard version"
+    players = gameState.players
+    counts = [0] * len(players)
+    regions: Dict[int, Set[Tuple[int, int]]] = {}
+    # the turn each body cell is free from, a cell shared by stacked segments is left by the first of them last
+    releaseTurns: Dict[Tuple[int, int], int] = {}
+    taken: Set[Tuple[int, int]] = set()
+    for i in range(len(players)):
+        player = players[i]
+        if not player.alive or player.head is None:
+            continue
+        regions[i] = {player.head}
+        taken.add(player.head)
+        for k in range(len(player.body) - 1, 0, -1):
+            if player.body[k] != player.head:
+                releaseTurns[player.body[k]] = len(player.body) - k
+
+    def free(cell: Tuple[int, int], turn: int) -> bool:
+        x, y = cell
+        return 0 <= x < gameState.width and 0 <= y < gameState.height and cell not in taken and releaseTurns.get(cell, 0) <= turn
+
+    lastRelease = max(releaseTurns.values(), default=0)
+    turn = 0
+    grown = True
+    while grown or turn < lastRelease:
+        turn = turn + 1
+        reached: Dict[Tuple[int, int], List[int]] = {}
+        for i in regions:
+            for (x, y) in regions[i]:
+                for cell in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+                    if free(cell, turn) and i not in reached.get(cell, []):
+                        reached.setdefault(cell, []).append(i)
+        grown = False
+        for cell, reachers in reached.items():
+            longest = max(len(players[i].body) for i in reachers)
+            winners = [i for i in reachers if len(players[i].body) == longest]
+            if len(winners) == 1:
+                regions[winners[0]].add(cell)
+                counts[winners[0]] = counts[winners[0]] + 1
+                grown = True
+        taken.update(reached)
+    return counts
+
+def territoryCheck(positions: List[GameState]) -> int:
+    """
+    Mismatches of voronoiTerritory against referenceTerritory, on the positions
+    and on copies of them with every tail doubled like right after eating,
+    where two segments share the tail cell.
+    """
+    mismatches = 0
+    for state in positions:
+        stacked = state.deepCopy()
+        for player in stacked.players:
+            if player.alive and len(player.body) > 1:
+                player.setBody(player.body + [player.body[-1]])
+        for checked in [state, stacked]:
+            if voronoiTerritory(checked) != referenceTerritory(checked):
+                mismatches = mismatches + 1
+    return mismatches
+
+random.seed(0)
+failed = False
+for size in [7, 11, 19]:
+    for opponents in [1, 3]:
+        positions = [state for state in GameSimulator.getRandomPositions(size, size, opponents, 100, 3 * size) if not state.isEndState()]
+        mismatches = territoryCheck(positions)
+        failed = failed or mismatches > 0
+        start = time.perf_counter()
+        for state in positions:
+            voronoiTerritory(state)
+        fillMicroseconds = (time.perf_counter() - start) / len(positions) * 1e6
+
+        plain = MinimaxAgent(1)
+        territory = MinimaxAgent(1)
+        territory.territoryWeight = 1.0
+        without = leafThroughput(plain, positions, 10)
+        withTerritory = leafThroughput(territory, positions, 10)
+        print(f"{size}x{size}, {opponents} opponents: territory fill {fillMicroseconds:.0f}us, "
+            f"leaf evaluations {round(without)}/s without territory, {round(withTerritory)}/s with territory, mismatches {mismatches}")
+
+if failed:
+    sys.exit("voronoiTerritory disagrees with referenceTerritory")
@@ -0,0 +1,47 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+import numpy as np
+import torch
+from cnn_inference import BoardEncoder, ScriptedSnakeInference, SnakeInference, export_torchscript, load_model
+from train import GameSimulator
+
+def latencies(model: SnakeInference, batches, calls: int):
+    times = []
+    for i in range(calls):
+        start = time.perf_counter()
+        model.board_values(batches[i % len(batches)])
+        times.append(time.perf_counter() - start)
+    return times
+
+random.seed(0)
+np.random.seed(0)
+torch.manual_seed(0)
+positions = GameSimulator.getRandomPositions(11, 11, 3, 50, 30)
+boards = np.concatenate([BoardEncoder.encode_actions(state, state.getLegalActions()) for state in positions])
+
+# untrained weights, the timings don't depend on them
+directory = tempfile.mkdtemp()
+modelPath = os.path.join(directory, 'snake-model.pth')
+scriptedPath = os.path.join(directory, 'snake-model.pt')
+torch.save(load_model(None).state_dict(), modelPath)
+export_torchscript(scriptedPath, modelPath)
+
+torch.set_num_threads(1)
+eager = SnakeInference(modelPath)
+start = time.perf_counter()
+scripted = ScriptedSnakeInference(scriptedPath, threads=1)
+print(f"scripted model loaded and warmed up in {time.perf_counter() - start:.2f}s")
+print(f"largest difference to the eager model: {np.abs(eager.board_values(boards) - scripted.board_values(boards)).max():.2e}")
+
+for size in [1, 3, 16, 64, 256]:
+    batches = [boards[np.random.randint(len(boards), size=size)] for _ in range(8)]
+    calls = max(2000 // size, 20)
+    results = []
+    for model in [eager, scripted]:
+        latencies(model, batches, 5)
+        times = sorted(latencies(model, batches, calls))
+        results.append(f"median {statistics.median(times) * 1e3:.2f}ms, p99 {times[int(len(times) * 0.99) - 1] * 1e3:.2f}ms, {size * len(times) / sum(times):.0f} boards/s")
+    print(f"batch {size}: eager {results[0]} | torchscript {results[1]}")
@@ -0,0 +1,44 @@
+import random
+import time
+from agents import AlphaBetaAgent
+from train import GameSimulator
+
+def nextTurn(agent: AlphaBetaAgent, state):
+    "Plays out one round with our agent's move and random opponents, the way the next /move request would look"
+    state.makeMove(agent.getAction(state), 0)
+    for index in range(1, len(state.players)):
+        legalMoves = state.getLegalActions(index)
+        state.makeMove(random.choice(legalMoves) if len(legalMoves) > 0 else None, index, False)
+
+random.seed(0)
+positions = GameSimulator.getRandomPositions(11, 11, 1, 10, 22)
+for depth in range(3, 7):
+    plainNodes = 0
+    firstNodes = 0
+    repeatNodes = 0
+    turnNodes = 0
+    hits = misses = collisions = 0
+    start = time.perf_counter()
+    for position in positions:
+        plain = AlphaBetaAgent(depth, 0)
+        memo = AlphaBetaAgent(depth)
+        state = position.deepCopy()
+
+        plain.getAction(state)
+        plainNodes = plainNodes + plain.nodes
+        memo.getAction(state)
+        firstNodes = firstNodes + memo.nodes
+        # searching the same position again, as an iterative deepening driver or a retried request does
+        memo.getAction(state)
+        repeatNodes = repeatNodes + memo.nodes
+        # searching the next turn's position with the entries of this turn
+        if not state.isEndState():
+            nextTurn(plain, state)
+            if not state.isEndState():
+                memo.getAction(state)
+                turnNodes = turnNodes + memo.nodes
+
+        stats = memo.transpositions.getStats()
+        hits, misses, collisions = hits + stats['hits'], misses + stats['misses'], collisions + stats['collisions']
+    print(f"depth {depth}: nodes without table {plainNodes}, first search {firstNodes}, repeated search {repeatNodes}, next turn {turnNodes}, "
+        f"table hits {hits}, misses {misses}, collisions {collisions} ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,167 @@
+import json
+import mmap
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from cnn_inference import BoardEncoder
+from dataset import DatasetReader, isBinaryDataset
+
+
+INDEX = 'index.json'
+# the arrays of every board size: the boards of (gameState, action), the state channels of
+# nextState, the rewards and whether the game goes on after nextState
+ARRAYS = ['boards', 'next_states', 'rewards', 'ongoing']
+DTYPES = {'uint8': np.uint8, 'float16': np.float16}
+# pages of the mapped arrays kept resident before they are handed back to the page cache
+CACHE_MEGABYTES = 256
+
+
+class MappedArray():
+  """
+  A .npy file mapped into memory, array being a zero-copy view of its data.
+  Pages only take memory once they are touched and release drops them again.
+  Read-only files are mapped copy-on-write, so the array is writable without
+  ever changing the file, but anything written to it is lost on release.
+  """
+  def __init__(self, filename, writable=False):
+    with open(filename, 'r+b' if writable else 'rb') as file:
+      version = np.lib.format.read_magic(file)
+      read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+      shape, _, dtype = read_header(file)
+      offset = file.tell()
+      self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY)
+    self.array = np.frombuffer(self.mapping, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+  def create(filename, shape, dtype):
+    "A new zeroed .npy file of the shape, mapped writable"
+    np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape).flush()
+    return MappedArray(filename, writable=True)
+  create = staticmethod(create)
+
+  def release(self):
+    # written pages of a writable mapping stay in the page cache until they are flushed
+    if hasattr(mmap, 'MADV_DONTNEED'):
+      self.mapping.madvise(mmap.MADV_DONTNEED)
+
+  def flush(self):
+    self.mapping.flush()
+
+
+def array_path(directory, size, name):
+  return os.path.join(directory, f'{size[0]}x{size[1]}-{name}.npy')
+
+
+def preprocess_dataset(source, directory, native=False, dtype='uint8', seed=0, cache_megabytes=CACHE_MEGABYTES):
+  # encodes the records of a JSON or binary dataset once into .npy files of every board size, the
+  # records shuffled so that batches of consecutive records mix the episodes, returns the record
+  # counts by board size. Every channel value is a small integer, so uint8 and float16 are exact
+  binary = isBinaryDataset(source)
+  records = DatasetReader(source) if binary else json.load(open(source))
+  counts = {}
+  for record in records:
+    size = BoardEncoder.board_size(record['gameState'], native)
+    counts[size] = counts.get(size, 0) + 1
+
+  os.makedirs(directory, exist_ok=True)
+  rng = np.random.default_rng(seed)
+  channels = len(BoardEncoder.CHANNEL_NAMES)
+  groups = {}
+  for size, count in counts.items():
+    arrays = [
+      MappedArray.create(array_path(directory, size, 'boards'), (count, channels) + size, DTYPES[dtype]),
+      MappedArray.create(array_path(directory, size, 'next_states'), (count, BoardEncoder.ACTIONS) + size, DTYPES[dtype]),
+      MappedArray.create(array_path(directory, size, 'rewards'), (count,), np.float32),
+      MappedArray.create(array_path(directory, size, 'ongoing'), (count,), np.uint8),
+    ]
+    # the position every record of the group is written to, and the number written so far
+    groups[size] = [arrays, rng.permutation(count), 0]
+
+  cache_bytes = cache_megabytes * (1 << 20)
+  written_bytes = 0
+  for record in records:
+    group = groups[BoardEncoder.board_size(record['gameState'], native)]
+    (boards, next_states, rewards, ongoing), positions, written = group
+    i = positions[written]
+    group[2] = written + 1
+    BoardEncoder.encode(record, out=boards.array[i])
+    BoardEncoder.encode_state(record['nextState'], next_states.array[i])
+    rewards.array[i] = record['reward']
+    ongoing.array[i] = not record['nextState']['endState']
+
+    written_bytes = written_bytes + boards.array[i].nbytes + next_states.array[i].nbytes
+    if written_bytes > cache_bytes:
+      for arrays, _, _ in groups.values():
+        for array in arrays:
+          array.flush()
+          array.release()
+      written_bytes = 0
+
+  for arrays, _, _ in groups.values():
+    for array in arrays:
+      array.flush()
+  index = {
+    'native': native,
+    'dtype': dtype,
+    'groups': [{'rows': size[0], 'cols': size[1], 'count': count} for size, count in counts.items()],
+  }
+  json.dump(index, open(os.path.join(directory, INDEX), 'w'), indent=4)
+  return counts
+
+
+class EncodedDataset(Dataset):
+  """
+  The arrays of preprocess_dataset served a batch per item, as tensors that
+  are zero-copy views of the mapped files: boards (B, 15, H, W), next_states
+  (B, 10, H, W) with only the state channels, rewards (B,) and ongoing (B,).
+  A batch is a run of consecutive records of one board size, the records were
+  shuffled by the preprocessing, so load it with DataLoader(batch_size=None,
+  shuffle=True). Once the batches served pass cache_megabytes the mapped pages
+  are released, which bounds the memory an epoch takes. The files are mapped
+  on first use, so every DataLoader worker maps its own.
+  """
+  def __init__(self, directory, batch_size=64, cache_megabytes=CACHE_MEGABYTES):
+    self.directory = directory
+    self.batch_size = batch_size
+    self.cache_bytes = cache_megabytes * (1 << 20)
+    index = json.load(open(os.path.join(directory, INDEX)))
+    self.native = index['native']
+    self.dtype = index['dtype']
+    self.sizes = [(group['rows'], group['cols']) for group in index['groups']]
+    self.records = sum(group['count'] for group in index['groups'])
+    # (board size index, first record, end record) of every batch
+    self.batches = []
+    for i in range(len(self.sizes)):
+      count = index['groups'][i]['count']
+      self.batches.extend([(i, start, min(start + batch_size, count)) for start in range(0, count, batch_size)])
+    self.arrays = None
+    self.served_bytes = 0
+
+  def __len__(self):
+    return len(self.batches)
+
+  def __getitem__(self, index):
+    if self.arrays is None:
+      self.arrays = [[MappedArray(array_path(self.directory, size, name)) for name in ARRAYS] for size in self.sizes]
+    group, start, end = self.batches[index]
+    batch = tuple(torch.from_numpy(array.array[start:end]) for array in self.arrays[group])
+    self.served_bytes = self.served_bytes + sum(tensor.nbytes for tensor in batch)
+    if self.served_bytes > self.cache_bytes:
+      self.release()
+    return batch
+
+  def release(self):
+    # batches already served stay valid, their pages are read back from the page cache
+    for arrays in self.arrays or []:
+      for array in arrays:
+        array.release()
+    self.served_bytes = 0
+
+  def __getstate__(self):
+    # mappings can't be pickled, the DataLoader workers map the files again
+    state = dict(self.__dict__)
+    state['arrays'] = None
+    state['served_bytes'] = 0
+    return state
@@ -2,41 +2,139 @@ import torch
 
 import torch.nn as nn
 import torch.optim as optim
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
 
 import numpy as np
 from numpy import linalg as LA
+import random
 import uuid
 
+from dataset import loadDataset
+
 
 class SnakeInference():
 
-    def __init__(self):
-        self.model = CIFAR10Model(channel_count=15,
-                                  label_count=1)
-        self.model.load_state_dict(torch.load('snake-model-1.pth'))
-        self.model.eval()
+    def __init__(self, model_path='snake-model-1.pth', quantization=None, calibration_path='dataset.json', pooled=False):
+        # a PooledSnakeModel sees the boards at their native size, CIFAR10Model padded to 32x32
+        self.native = pooled
+        self.model = load_model(model_path, pooled)
+        # one of the Quantization modes, static calibrates on the examples dumped by dump-dataset.py
+        if quantization is not None:
+            calibration = calibration_boards(loadDataset(calibration_path), native=pooled) if quantization == Quantization.STATIC else None
+            self.model = quantize_model(self.model, quantization, calibration)
         
 
     def value(self, example):
-        shaped = ShapedExample(example)
-        board = shaped.board_curr.get_board()
-        input = torch.Tensor(np.array([board])).type(torch.FloatTensor)
-        inferred = self.model(input)
-        return inferred.detach().numpy()[0][0]
+        return self.values([example])[0]
+
+    def values(self, examples):
+        # all the (state, action) examples go through the model in one forward pass
+        return self.board_values(BoardEncoder.encode_batch(examples, self.native))
+
+    def state_values(self, game_state, actions):
+        # values of playing each of the actions from a GameState, without going through JSON
+        return self.board_values(BoardEncoder.encode_actions(game_state, actions, self.native))
+
+    def board_values(self, boards):
+        if len(boards) == 0:
+            return np.zeros(0, dtype=np.float32)
+        input = torch.from_numpy(boards)
+        with torch.inference_mode():
+            inferred = self.model(input)
+        return inferred.numpy()[:, 0]
+
+
+class ScriptedSnakeInference(SnakeInference):
+    """
+    Runs the TorchScript model written by export_torchscript, without Python
+    module dispatch. Warmed up when it is created, so the first moves don't
+    pay for the JIT's profiling runs.
+    """
+    WARM_UP_BATCHES = [1, 3, 16, 64]
+    WARM_UP_RUNS = 3
+
+    # board size the warm up runs an exported PooledSnakeModel on
+    WARM_UP_SIZE = 11
+
+    def __init__(self, scripted_path='snake-model-1.pt', threads=1, pooled=False):
+        # intra-op threads are set for the whole process, 1 keeps the latency steady next to the search
+        if threads is not None:
+            torch.set_num_threads(threads)
+        self.native = pooled
+        self.model = torch.jit.load(scripted_path)
+        self.model.eval()
+        size = ScriptedSnakeInference.WARM_UP_SIZE if pooled else BoardEncoder.CNN_SIZE
+        for count in ScriptedSnakeInference.WARM_UP_BATCHES:
+            for _ in range(ScriptedSnakeInference.WARM_UP_RUNS):
+                self.board_values(BoardEncoder.new_board(count, size, size))
+
+
+def load_model(model_path='snake-model-1.pth', pooled=False):
+    model_class = PooledSnakeModel if pooled else CIFAR10Model
+    model = model_class(channel_count=15,
+                        label_count=1)
+    # model_path=None keeps the untrained weights, for benchmarks
+    if model_path is not None:
+        model.load_state_dict(torch.load(model_path))
+    model.eval()
+    return model
+
+
+class Quantization():
+    # int8 weights for the linear layers, fc3 holds 4.2M of the model's 4.3M weights
+    DYNAMIC = 'dynamic'
+    # the convolutions too, with activation ranges calibrated on dataset boards
+    STATIC = 'static'
+    CALIBRATION_EXAMPLES = 512
+
+
+def quantize_model(model, quantization, calibration=None):
+    # calibration is a batch of boards, only used by static quantization
+    if quantization == Quantization.DYNAMIC:
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if quantization == Quantization.STATIC:
+        inputs = torch.from_numpy(calibration)
+        prepared = prepare_fx(model, get_default_qconfig_mapping(torch.backends.quantized.engine), (inputs[:1],))
+        with torch.inference_mode():
+            for start in range(0, len(inputs), 64):
+                prepared(inputs[start:start + 64])
+        return convert_fx(prepared)
+    raise ValueError(f"Unknown quantization {quantization}")
+
+
+def calibration_boards(examples, count=Quantization.CALIBRATION_EXAMPLES, native=False):
+    # the same sample every time, so a model quantizes the same way in every worker
+    sample = random.Random(0).sample(examples, min(count, len(examples)))
+    return BoardEncoder.encode_batch(sample, native)
+
+
+def export_torchscript(scripted_path='snake-model-1.pt', model_path='snake-model-1.pth', quantization=None, calibration=None, pooled=False):
+    # traced in eval mode, so the dropout layers are left out, and frozen so the weights are constants
+    model = load_model(model_path, pooled)
+    if quantization is not None:
+        model = quantize_model(model, quantization, calibration)
+    size = ScriptedSnakeInference.WARM_UP_SIZE if pooled else BoardEncoder.CNN_SIZE
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.from_numpy(BoardEncoder.new_board(1, size, size)))
+    torch.jit.freeze(traced).save(scripted_path)
 
 
 class ShapedExample():
   
-  def __init__(self, example):
+  def __init__(self, example, native=False):
     self.example = example
-    self.board_curr = GameBoard(example, example['gameState'])
+    self.board_curr = GameBoard(example, example['gameState'], native=native)
     try:
-        self.board_next = GameBoard(example, example['nextState']) 
+        # the next state is encoded once for the actual action and the four alternatives
+        actions = ['left', 'right', 'up', 'down']
+        boards = BoardEncoder.encode_actions(example['nextState'], [example['action']] + actions, native)
+        self.board_next = GameBoard(example, example['nextState'], boards[0])
         self.board_alts = []
-        for action in ['left', 'right', 'up', 'down']:
+        for i in range(len(actions)):
           alt = self.example.copy()
-          alt['action'] = action
-          board = GameBoard(alt, example['nextState'])
+          alt['action'] = actions[i]
+          board = GameBoard(alt, example['nextState'], boards[i + 1])
           self.board_alts.append(board)
     except:
         #print("NEXT_STATE_IS_UNKNOWN")
@@ -45,29 +143,19 @@ class ShapedExample():
 
 class GameBoard():
 
-  def __init__(self, example, state):
+  def __init__(self, example, state, board=None, native=False):
     ### general
     self.id = uuid.uuid4()
     # channel
-    self.channel_names = ['self_head', 'self_body', 'self_health', 'self_length',
-                          'adversary_head', 'adversary_body', 'adversary_health', 'adversary_length',
-                          'food', 'hazards', 
-                          'left', 'right', 'down', 'up', 
-                          "None"]
-    # size
-    cnn_size = 32
-    if state['height'] > cnn_size or state['height'] > cnn_size:
-      raise NotImplementedError("CNN only supports 32x32 grid")
-    self.rows = cnn_size 
-    self.cols = cnn_size                           
+    self.channel_names = list(BoardEncoder.CHANNEL_NAMES)
     ### specific
     self.example = example
     self.state = state
-    self.set_board()
-    self.set_food()
-    self.set_hazard()
-    self.set_player()
-    self.set_action()
+    # one (channels, rows, cols) float32 array encoded by BoardEncoder, board is the
+    # encoding of (state, example['action']) when the caller already has it
+    self.board = BoardEncoder.encode(example, state, native=native) if board is None else board
+    self.rows = self.board.shape[1]
+    self.cols = self.board.shape[2]
 
   def get_id(self):
     return self.id
@@ -83,12 +171,6 @@ class GameBoard():
       name = "None"
     return self.channel_names.index(name)
 
-  def set_board(self):
-    board = []
-    for i in range(self.channel_count()):
-      board.append(self.new_channel())
-    self.board = board
-
   def get_board(self):
     return self.board
 
@@ -99,63 +181,119 @@ class GameBoard():
       pass
     return 0
 
-  def new_channel(self):
-    channel = np.zeros((self.rows, self.cols))
-    return channel
-
   def get_channel(self, name):
     return self.board[self.channel_idx(name)]
 
   def set_channel(self, name, channel):
     self.board[self.channel_idx(name)] = channel
 
-  def mark_channel(self, name, locations, value=1):
-    channel = self.get_channel(name)
-    if isinstance(locations, list):
-      for loc in locations:
-        x, y = loc
-        curr = channel[x][y]
-        channel[x][y] = max([value, curr])
+
+class BoardEncoder():
+  """
+  Writes the GameBoard channels of (state, action) examples straight into
+  float32 arrays, (channels, 32, 32) for one example or (N, channels, 32, 32)
+  for a batch. States can be JSON dicts or GameState objects. With
+  native=True the boards are (channels, width, height) instead of padded to
+  32x32, for PooledSnakeModel.
+  """
+  CHANNEL_NAMES = ['self_head', 'self_body', 'self_health', 'self_length',
+                   'adversary_head', 'adversary_body', 'adversary_health', 'adversary_length',
+                   'food', 'hazards',
+                   'left', 'right', 'down', 'up',
+                   "None"]
+  CNN_SIZE = 32
+  # offsets of the head, body, health and length channels from the self or adversary channel
+  HEAD, BODY, HEALTH, LENGTH = 0, 1, 2, 3
+  SELF = CHANNEL_NAMES.index('self_head')
+  ADVERSARY = CHANNEL_NAMES.index('adversary_head')
+  FOOD = CHANNEL_NAMES.index('food')
+  HAZARDS = CHANNEL_NAMES.index('hazards')
+  # the action channels come after all the state channels
+  ACTIONS = CHANNEL_NAMES.index('left')
+
+  def channel_idx(name):
+    if name is None:
+      name = "None"
+    return BoardEncoder.CHANNEL_NAMES.index(name)
+  channel_idx = staticmethod(channel_idx)
+
+  def new_board(count=None, rows=CNN_SIZE, cols=CNN_SIZE):
+    shape = (len(BoardEncoder.CHANNEL_NAMES), rows, cols)
+    return np.zeros(shape if count is None else (count,) + shape, dtype=np.float32)
+  new_board = staticmethod(new_board)
+
+  def board_size(state, native=False):
+    # rows are x and columns y, the way mark_channel indexes the channels
+    if not native:
+      return (BoardEncoder.CNN_SIZE, BoardEncoder.CNN_SIZE)
+    return (state['width'], state['height']) if isinstance(state, dict) else (state.width, state.height)
+  board_size = staticmethod(board_size)
+
+  def encode(example, state=None, out=None, native=False):
+    "Board of one example, state defaults to example['gameState']. out is a zeroed board to write into"
+    state = example['gameState'] if state is None else state
+    board = BoardEncoder.new_board(None, *BoardEncoder.board_size(state, native)) if out is None else out
+    BoardEncoder.encode_state(state, board)
+    BoardEncoder.encode_action(example['action'], board)
+    return board
+  encode = staticmethod(encode)
+
+  def encode_batch(examples, native=False):
+    # native boards of a batch all have the size of the first one
+    size = BoardEncoder.board_size(examples[0]['gameState'], native) if len(examples) > 0 else (BoardEncoder.CNN_SIZE, BoardEncoder.CNN_SIZE)
+    boards = BoardEncoder.new_board(len(examples), *size)
+    for i in range(len(examples)):
+      BoardEncoder.encode(examples[i], out=boards[i])
+    return boards
+  encode_batch = staticmethod(encode_batch)
+
+  def encode_actions(state, actions, native=False):
+    "Boards of playing each of the actions from one state, which is encoded only once"
+    boards = BoardEncoder.new_board(len(actions), *BoardEncoder.board_size(state, native))
+    if len(actions) > 0:
+      BoardEncoder.encode_state(state, boards[0])
+      # the boards only differ in the action channels
+      boards[1:, :BoardEncoder.ACTIONS] = boards[0, :BoardEncoder.ACTIONS]
+    for i in range(len(actions)):
+      BoardEncoder.encode_action(actions[i], boards[i])
+    return boards
+  encode_actions = staticmethod(encode_actions)
+
+  def encode_state(state, board):
+    if isinstance(state, dict):
+      height, width, food, hazards = state['height'], state['width'], state['food'], state['hazards']
+      players = [(p['alive'], p['ours'], p['head'], p['body'], p['health']) for p in state['players']]
     else:
-      for y, x in np.ndindex(channel.shape):
-        curr = channel[x][y]
-        channel[x][y] = max([value, curr])
-    self.set_channel(name, channel)
-    
-  def set_food(self, name='food'):
-    self.mark_channel(name, self.state[name])
-
-  def set_hazard(self, name='hazards'):
-    self.mark_channel(name, self.state[name])
-
-  def set_action(self, name='action'):
-    actual = self.example[name]
-    self.mark_channel(actual, actual)
-
-  def set_player(self):
-    # {'health': 100,
-    # 'body': [[6, 8]],
-    # 'head': [6, 8],
-    # 'length': 1,
-    # 'id': 1,
-    # 'alive': True,
-    # 'ours': True}
-    for player in self.state['players']:
-      health = player['health']
-      body = player['body']
-      head = [player['head']]
-      length = player['length']
-      if player['alive']:
-        if player['ours']:
-          self.mark_channel('self_health', health, health)
-          self.mark_channel('self_body', body)
-          self.mark_channel('self_head', head)
-          self.mark_channel('self_length', length)
-        else:
-          self.mark_channel('adversary_health', health, health)
-          self.mark_channel('adversary_body', body)
-          self.mark_channel('adversary_head', head)
-          self.mark_channel('adversary_length', length)
+      height, width, food, hazards = state.height, state.width, state.food, state.hazards
+      players = [(p.alive, p.ours, p.head, p.body, p.health) for p in state.players]
+    rows, size = board.shape[1], board.shape[2]
+    if width > rows or height > size:
+      raise NotImplementedError(f"CNN only supports {rows}x{size} grid")
+
+    plane = rows * size
+    # flat indices of all the cells set to 1, the max with 1 of mark_channel is a plain store on 0/1 channels
+    cells = [BoardEncoder.FOOD * plane + x * size + y for (x, y) in food]
+    cells.extend([BoardEncoder.HAZARDS * plane + x * size + y for (x, y) in hazards])
+    healths = {}
+    for (alive, ours, head, body, health) in players:
+      if alive:
+        channel = BoardEncoder.SELF if ours else BoardEncoder.ADVERSARY
+        cells.append((channel + BoardEncoder.HEAD) * plane + head[0] * size + head[1])
+        offset = (channel + BoardEncoder.BODY) * plane
+        cells.extend([offset + x * size + y for (x, y) in body])
+        healths[channel] = max(health, healths.get(channel, 0))
+    board.reshape(-1)[cells] = 1
+
+    for channel in healths:
+      # the scalar channels are filled, with the highest health of the side
+      board[channel + BoardEncoder.HEALTH].fill(healths[channel])
+      # mark_channel fills the length channel with 1, not the length
+      board[channel + BoardEncoder.LENGTH].fill(1)
+  encode_state = staticmethod(encode_state)
+
+  def encode_action(action, board):
+    board[BoardEncoder.channel_idx(action)].fill(1)
+  encode_action = staticmethod(encode_action)
 
 
 class CIFAR10Model(nn.Module):
@@ -205,3 +343,63 @@ class CIFAR10Model(nn.Module):
         # input 512, output 10
         x = self.fc4(x)
         return x        
+
+
+class PooledSnakeModel(nn.Module):
+    """
+    CIFAR10Model's convolutions with a global pooling head in place of the
+    8192 wide fc3, so it runs on boards of any size at their native resolution
+    instead of padded to 32x32.
+    """
+    def __init__(self,
+                 channel_count,
+                 label_count = 1
+                 ):
+        super().__init__()
+        self.conv1 = nn.Conv2d(in_channels=channel_count,
+                               out_channels=32,
+                               kernel_size=(3,3),
+                               stride=1,
+                               padding=1)
+        self.act1 = nn.ReLU()
+        self.drop1 = nn.Dropout(0.3)
+
+        self.conv2 = nn.Conv2d(in_channels=32,
+                               out_channels=32,
+                               kernel_size=(3,3),
+                               stride=1,
+                               padding=1)
+        self.act2 = nn.ReLU()
+        self.pool2 = nn.MaxPool2d(kernel_size=(2, 2))
+
+        # widens the receptive field to most of an 11x11 board before pooling it away
+        self.conv3 = nn.Conv2d(in_channels=32,
+                               out_channels=64,
+                               kernel_size=(3,3),
+                               stride=1,
+                               padding=1)
+        self.act3 = nn.ReLU()
+        self.avg3 = nn.AdaptiveAvgPool2d(1)
+        self.max3 = nn.AdaptiveMaxPool2d(1)
+        self.flat = nn.Flatten()
+
+        self.fc4 = nn.Linear(128, 128)
+        self.act4 = nn.ReLU()
+        self.drop4 = nn.Dropout(0.5)
+
+        self.fc5 = nn.Linear(128, label_count)
+
+    def forward(self, x):
+        # input 15xWxH, output 32xWxH
+        x = self.drop1(self.act1(self.conv1(x)))
+        # input 32xWxH, output 32x(W/2)x(H/2)
+        x = self.pool2(self.act2(self.conv2(x)))
+        # input 32x(W/2)x(H/2), output 64x(W/2)x(H/2)
+        x = self.act3(self.conv3(x))
+        # input 64x(W/2)x(H/2), output 128
+        x = torch.cat([self.flat(self.avg3(x)), self.flat(self.max3(x))], dim=1)
+        # input 128, output 128
+        x = self.drop4(self.act4(self.fc4(x)))
+        # input 128, output label_count
+        x = self.fc5(x)
+        return x
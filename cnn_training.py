@@ -0,0 +1,159 @@
+import os
+import random
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+
+from cnn_inference import BoardEncoder
+
+
+# the alternatives ShapedExample.board_alts scores the next state with
+NEXT_ACTIONS = ['left', 'right', 'up', 'down']
+
+
+def is_end_state(state):
+  return state['endState'] if isinstance(state, dict) else state.endState
+
+
+def td_targets(model, examples, native=False, gamma=0.9):
+  # reward + gamma * the best value of the next state, the reward alone once the game is over
+  boards = np.concatenate([BoardEncoder.encode_actions(example['nextState'], NEXT_ACTIONS, native) for example in examples])
+  with torch.inference_mode():
+    values = model(torch.from_numpy(boards)).numpy()[:, 0].reshape(len(examples), len(NEXT_ACTIONS)).max(axis=1)
+  rewards = np.array([example['reward'] for example in examples], dtype=np.float32)
+  ongoing = np.array([not is_end_state(example['nextState']) for example in examples], dtype=np.float32)
+  return rewards + gamma * values * ongoing
+
+
+def train_model(model, examples, epochs=1, native=False, gamma=0.9, learning_rate=1e-3, batch_size=64):
+  # fits the model to fitted Q targets of dumped (gameState, action, reward, nextState) examples,
+  # returns the mean loss of each epoch
+  optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+  loss_function = nn.MSELoss()
+  # native boards of different sizes can't share a batch
+  groups = {}
+  for example in examples:
+    groups.setdefault(BoardEncoder.board_size(example['gameState'], native), []).append(example)
+
+  losses = []
+  for _ in range(epochs):
+    batches = []
+    for group in groups.values():
+      random.shuffle(group)
+      batches.extend([group[start:start + batch_size] for start in range(0, len(group), batch_size)])
+    random.shuffle(batches)
+
+    total = 0.0
+    for batch in batches:
+      model.eval()
+      targets = torch.from_numpy(td_targets(model, batch, native, gamma))
+      model.train()
+      inputs = torch.from_numpy(BoardEncoder.encode_batch(batch, native))
+      optimizer.zero_grad()
+      loss = loss_function(model(inputs)[:, 0], targets)
+      loss.backward()
+      optimizer.step()
+      total = total + loss.item() * len(batch)
+    losses.append(total / max(len(examples), 1))
+
+  model.eval()
+  return losses
+
+
+def next_action_boards(next_states):
+  # the float32 boards of playing each of NEXT_ACTIONS from the next states of an EncodedDataset batch,
+  # (B * 4, 15, H, W) in the order of encode_actions
+  count, rows, cols = next_states.shape[0], next_states.shape[2], next_states.shape[3]
+  boards = torch.empty((count, len(NEXT_ACTIONS), len(BoardEncoder.CHANNEL_NAMES), rows, cols), dtype=torch.float32)
+  boards[:, :, :BoardEncoder.ACTIONS] = next_states[:, None]
+  boards[:, :, BoardEncoder.ACTIONS:] = 0
+  for i in range(len(NEXT_ACTIONS)):
+    boards[:, i, BoardEncoder.channel_idx(NEXT_ACTIONS[i])] = 1
+  return boards.reshape(count * len(NEXT_ACTIONS), len(BoardEncoder.CHANNEL_NAMES), rows, cols)
+
+
+def encoded_td_targets(model, next_states, rewards, ongoing, gamma=0.9):
+  # td_targets of an EncodedDataset batch
+  with torch.inference_mode():
+    values = model(next_action_boards(next_states))[:, 0].reshape(len(rewards), len(NEXT_ACTIONS)).max(dim=1).values
+  return rewards + gamma * values * ongoing.float()
+
+
+def init_loader_worker(_):
+  # the loader workers only slice the mapped arrays, the training process keeps the cores for the model
+  torch.set_num_threads(1)
+
+
+def save_checkpoint(path, model, optimizer, epoch, batch, total, losses):
+  # written next to the checkpoint and renamed over it, so an interrupted save leaves the last one intact
+  checkpoint = {
+    'model': model.state_dict(),
+    'optimizer': optimizer.state_dict(),
+    'epoch': epoch,
+    'batch': batch,
+    'total': total,
+    'losses': losses,
+    # dropout draws from the global generator
+    'rng': torch.get_rng_state(),
+  }
+  torch.save(checkpoint, path + '.tmp')
+  os.replace(path + '.tmp', path)
+
+
+def train_encoded_model(model, dataset, epochs=1, gamma=0.9, learning_rate=1e-3, workers=0, seed=0,
+                        checkpoint_path=None, checkpoint_seconds=60.0, log_seconds=10.0):
+  # train_model on the batches of an EncodedDataset, in a new order every epoch, returns the mean loss of each epoch.
+  # The batch order of an epoch only depends on the seed, so training saved to checkpoint_path at the end of
+  # every epoch and every checkpoint_seconds resumes from the batch it was at when the checkpoint exists
+  optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+  loss_function = nn.MSELoss()
+  first_epoch, first_batch, total, losses = 0, 0, 0.0, []
+  if checkpoint_path is not None and os.path.exists(checkpoint_path):
+    checkpoint = torch.load(checkpoint_path)
+    model.load_state_dict(checkpoint['model'])
+    optimizer.load_state_dict(checkpoint['optimizer'])
+    first_epoch, first_batch, total, losses = checkpoint['epoch'], checkpoint['batch'], checkpoint['total'], checkpoint['losses']
+    torch.set_rng_state(checkpoint['rng'])
+    print(f"Resuming from {checkpoint_path} at epoch #{first_epoch + 1} batch {first_batch}")
+
+  for epoch in range(first_epoch, epochs):
+    generator = torch.Generator().manual_seed(seed * 1000003 + epoch)
+    order = torch.randperm(len(dataset), generator=generator).tolist()
+    # the loader seeds its workers from the generator, which leaves the global one to dropout
+    loader = DataLoader(dataset, batch_size=None, sampler=order[first_batch:], num_workers=workers,
+                        worker_init_fn=init_loader_worker if workers > 0 else None, generator=generator)
+    started = saved = logged = time.perf_counter()
+    samples = epoch_samples = 0
+    for batch, (boards, next_states, rewards, ongoing) in enumerate(loader, first_batch + 1):
+      model.eval()
+      targets = encoded_td_targets(model, next_states, rewards, ongoing, gamma)
+      model.train()
+      optimizer.zero_grad()
+      loss = loss_function(model(boards.float())[:, 0], targets)
+      loss.backward()
+      optimizer.step()
+      total = total + loss.item() * len(rewards)
+      samples = samples + len(rewards)
+      epoch_samples = epoch_samples + len(rewards)
+
+      now = time.perf_counter()
+      if now - logged >= log_seconds:
+        print(f"Epoch #{epoch + 1} batch {batch}/{len(dataset)}: loss {loss.item():.5f}, {samples / (now - logged):.0f} samples/s")
+        logged, samples = now, 0
+      if checkpoint_path is not None and now - saved >= checkpoint_seconds and batch < len(dataset):
+        save_checkpoint(checkpoint_path, model, optimizer, epoch, batch, total, losses)
+        saved = now
+
+    losses.append(total / max(dataset.records, 1))
+    elapsed = time.perf_counter() - started
+    print(f"Epoch #{epoch + 1} loss {losses[-1]:.5f}, {epoch_samples / max(elapsed, 1e-9):.0f} samples/s")
+    first_batch, total = 0, 0.0
+    if checkpoint_path is not None:
+      save_checkpoint(checkpoint_path, model, optimizer, epoch + 1, 0, 0.0, losses)
+
+  model.eval()
+  return losses
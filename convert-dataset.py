@@ -0,0 +1,8 @@
+import sys
+from dataset import convertDataset
+
+# convert-dataset.py [dataset.json] [dataset.bin], converts a JSON dataset to the binary format, or back to JSON if the destination ends with .json
+source = sys.argv[1] if len(sys.argv) > 1 else 'dataset.json'
+destination = sys.argv[2] if len(sys.argv) > 2 else 'dataset.bin'
+
+print(f"Converted {convertDataset(source, destination)} records from {source} to {destination}")
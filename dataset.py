@@ -0,0 +1,262 @@
+from __future__ import annotations
+import json
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+class DatasetWriter:
+    """
+    Streams (gameState, action, reward, nextState) records to a compact binary
+    file. Records are buffered per episode and written as one length-prefixed
+    chunk when the episode ends, so only the current episode is kept in memory.
+    States are stored as flat cells (y * width + x) and bodies as the head cell
+    followed by one direction byte per segment.
+
+    file:   MAGIC, then chunks
+    chunk:  u32 payload bytes, u32 records, records
+    record: u8 action, f64 reward, state, state
+    state:  u8 width, u8 height, u8 end flags, u16 food count, u16 hazard count,
+            u16 cells of the food and hazards, u8 players, players
+    player: id, i16 health, u8 alive/ours flags, u16 length, u16 body count,
+            u16 head cell, u8 direction of each next segment (ESCAPE + u16 cell if not adjacent)
+    id:     u8 kind, then i64 for ints or u16 length + utf-8 for strings
+    """
+    MAGIC = b'SNAKEDS1'
+    CHUNK = struct.Struct('<II')
+    RECORD = struct.Struct('<Bd')
+    STATE = struct.Struct('<BBBHH')
+    PLAYER = struct.Struct('<hBHH')
+    ACTIONS = ['up', 'down', 'left', 'right']
+    NO_ACTION = 255
+    # direction bytes of the segment after a cell, as (dx, dy) modulo the board
+    UP, DOWN, LEFT, RIGHT, ESCAPE = 0, 1, 2, 3, 255
+    INT_ID, STR_ID, NO_ID = 0, 1, 2
+    FLAGS = ('endState', 'won', 'lost', 'tie')
+
+    def __init__(self, out: BinaryIO, header: bool = True) -> None:
+        "header is left out for chunks that get appended to another file, like the shards of SelfPlay"
+        self.out = out
+        self.pending = bytearray()
+        self.pendingRecords = 0
+        self.records = 0
+        if header:
+            out.write(DatasetWriter.MAGIC)
+
+    def toFile(filename: str) -> DatasetWriter:
+        return DatasetWriter(open(filename, 'wb'))
+    toFile = staticmethod(toFile)
+
+    def append(self, record: Dict) -> None:
+        "record holds GameState objects like DataDumpAgent's, or the state dicts of JSON datasets"
+        action = record['action']
+        self.pending.extend(DatasetWriter.RECORD.pack(DatasetWriter.ACTIONS.index(action) if action is not None else DatasetWriter.NO_ACTION, record['reward']))
+        DatasetWriter.encodeState(record['gameState'], self.pending)
+        DatasetWriter.encodeState(record['nextState'], self.pending)
+        self.pendingRecords = self.pendingRecords + 1
+
+    def endEpisode(self) -> None:
+        "Writes the records of the episode as one chunk"
+        if self.pendingRecords == 0:
+            return
+        self.out.write(DatasetWriter.CHUNK.pack(len(self.pending), self.pendingRecords))
+        self.out.write(self.pending)
+        self.out.flush()
+        self.records = self.records + self.pendingRecords
+        self.pending = bytearray()
+        self.pendingRecords = 0
+
+    def writeChunks(self, chunks: bytes, records: int) -> None:
+        "Appends chunks written by a headerless writer"
+        self.endEpisode()
+        self.out.write(chunks)
+        self.out.flush()
+        self.records = self.records + records
+
+    def close(self) -> None:
+        self.endEpisode()
+        self.out.close()
+
+    def __enter__(self) -> DatasetWriter:
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+    def encodeState(state: Any, out: bytearray) -> None:
+        if isinstance(state, dict):
+            width, height, food, hazards, players = state['width'], state['height'], state['food'], state['hazards'], state['players']
+            flags = [state[flag] for flag in DatasetWriter.FLAGS]
+            players = [(p['id'], p['health'], p['alive'], p['ours'], p['length'], p['body']) for p in players]
+        else:
+            width, height, food, hazards = state.width, state.height, state.food, state.hazards
+            flags = [getattr(state, flag) for flag in DatasetWriter.FLAGS]
+            players = [(p.id, p.health, p.alive, p.ours, p.length, p.body) for p in state.players]
+
+        out.extend(DatasetWriter.STATE.pack(width, height, sum(1 << i for i in range(len(flags)) if flags[i]), len(food), len(hazards)))
+        cells = [y * width + x for (x, y) in food] + [y * width + x for (x, y) in hazards]
+        out.extend(struct.pack(f'<{len(cells)}H', *cells))
+        out.append(len(players))
+        for (id, health, alive, ours, length, body) in players:
+            if isinstance(id, int):
+                out.append(DatasetWriter.INT_ID)
+                out.extend(struct.pack('<q', id))
+            elif id is None:
+                out.append(DatasetWriter.NO_ID)
+            else:
+                name = str(id).encode('utf-8')
+                out.append(DatasetWriter.STR_ID)
+                out.extend(struct.pack('<H', len(name)))
+                out.extend(name)
+            out.extend(DatasetWriter.PLAYER.pack(health, int(bool(alive)) | int(bool(ours)) << 1, length, len(body)))
+            if len(body) == 0:
+                continue
+            x, y = body[0]
+            out.extend(struct.pack('<H', y * width + x))
+            for (nx, ny) in body[1:]:
+                delta = ((nx - x) % width, (ny - y) % height)
+                if delta == (0, 1 % height):
+                    out.append(DatasetWriter.UP)
+                elif delta == (0, (height - 1) % height):
+                    out.append(DatasetWriter.DOWN)
+                elif delta == ((width - 1) % width, 0):
+                    out.append(DatasetWriter.LEFT)
+                elif delta == (1 % width, 0):
+                    out.append(DatasetWriter.RIGHT)
+                else:
+                    out.append(DatasetWriter.ESCAPE)
+                    out.extend(struct.pack('<H', ny * width + nx))
+                x, y = nx, ny
+    encodeState = staticmethod(encodeState)
+
+class DatasetReader:
+    """
+    Reads the files of DatasetWriter back into the records of the JSON datasets:
+    dicts of gameState, action, reward and nextState, with the states in the
+    form CustomEncoder dumps them. Iterating streams one chunk at a time.
+    """
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    def __iter__(self) -> Iterator[Dict]:
+        with open(self.filename, 'rb') as file:
+            if file.read(len(DatasetWriter.MAGIC)) != DatasetWriter.MAGIC:
+                raise ValueError(f"{self.filename} is not a binary dataset")
+            while True:
+                header = file.read(DatasetWriter.CHUNK.size)
+                if len(header) < DatasetWriter.CHUNK.size:
+                    return
+                size, records = DatasetWriter.CHUNK.unpack(header)
+                chunk = file.read(size)
+                offset = 0
+                for _ in range(records):
+                    record, offset = DatasetReader.decodeRecord(chunk, offset)
+                    yield record
+
+    def readAll(self) -> List[Dict]:
+        return list(self)
+
+    def decodeRecord(data: bytes, offset: int):
+        action, reward = DatasetWriter.RECORD.unpack_from(data, offset)
+        offset = offset + DatasetWriter.RECORD.size
+        gameState, offset = DatasetReader.decodeState(data, offset)
+        nextState, offset = DatasetReader.decodeState(data, offset)
+        return ({
+            'gameState': gameState,
+            'action': DatasetWriter.ACTIONS[action] if action != DatasetWriter.NO_ACTION else None,
+            'reward': reward,
+            'nextState': nextState,
+        }, offset)
+    decodeRecord = staticmethod(decodeRecord)
+
+    def decodeState(data: bytes, offset: int):
+        width, height, flags, foodCount, hazardCount = DatasetWriter.STATE.unpack_from(data, offset)
+        offset = offset + DatasetWriter.STATE.size
+        cells = struct.unpack_from(f'<{foodCount + hazardCount}H', data, offset)
+        offset = offset + 2 * (foodCount + hazardCount)
+        coordinates = [[cell % width, cell // width] for cell in cells]
+        numPlayers = data[offset]
+        offset = offset + 1
+
+        players = []
+        for _ in range(numPlayers):
+            kind = data[offset]
+            offset = offset + 1
+            if kind == DatasetWriter.INT_ID:
+                id = struct.unpack_from('<q', data, offset)[0]
+                offset = offset + 8
+            elif kind == DatasetWriter.STR_ID:
+                size = struct.unpack_from('<H', data, offset)[0]
+                id = data[offset + 2:offset + 2 + size].decode('utf-8')
+                offset = offset + 2 + size
+            else:
+                id = None
+            health, playerFlags, length, bodyCount = DatasetWriter.PLAYER.unpack_from(data, offset)
+            offset = offset + DatasetWriter.PLAYER.size
+
+            body = []
+            if bodyCount > 0:
+                cell = struct.unpack_from('<H', data, offset)[0]
+                offset = offset + 2
+                x, y = cell % width, cell // width
+                body.append([x, y])
+                for _ in range(bodyCount - 1):
+                    direction = data[offset]
+                    offset = offset + 1
+                    if direction == DatasetWriter.UP:
+                        y = (y + 1) % height
+                    elif direction == DatasetWriter.DOWN:
+                        y = (y - 1) % height
+                    elif direction == DatasetWriter.LEFT:
+                        x = (x - 1) % width
+                    elif direction == DatasetWriter.RIGHT:
+                        x = (x + 1) % width
+                    else:
+                        cell = struct.unpack_from('<H', data, offset)[0]
+                        offset = offset + 2
+                        x, y = cell % width, cell // width
+                    body.append([x, y])
+            players.append({
+                'health': health,
+                'body': body,
+                'head': list(body[0]) if len(body) > 0 else None,
+                'length': length,
+                'id': id,
+                'alive': bool(playerFlags & 1),
+                'ours': bool(playerFlags & 2),
+            })
+
+        state = {
+            'height': height,
+            'width': width,
+            'food': coordinates[:foodCount],
+            'hazards': coordinates[foodCount:],
+            'players': players,
+        }
+        for i in range(len(DatasetWriter.FLAGS)):
+            state[DatasetWriter.FLAGS[i]] = bool(flags & (1 << i))
+        return (state, offset)
+    decodeState = staticmethod(decodeState)
+
+def isBinaryDataset(filename: str) -> bool:
+    with open(filename, 'rb') as file:
+        return file.read(len(DatasetWriter.MAGIC)) == DatasetWriter.MAGIC
+
+def loadDataset(filename: str) -> List[Dict]:
+    "Records of a JSON or binary dataset"
+    if isBinaryDataset(filename):
+        return DatasetReader(filename).readAll()
+    return json.load(open(filename))
+
+def convertDataset(source: str, destination: str) -> int:
+    "Converts a JSON dataset to the binary format or back, by the destination's extension. Returns the number of records"
+    if destination.endswith('.json'):
+        records = loadDataset(source)
+        json.dump(records, open(destination, 'w'), indent=4)
+        return len(records)
+
+    with DatasetWriter.toFile(destination) as writer:
+        for record in (DatasetReader(source) if isBinaryDataset(source) else json.load(open(source))):
+            writer.append(record)
+            # JSON datasets don't mark their episodes, so records are chunked at the end states
+            if record['nextState']['endState']:
+                writer.endEpisode()
+        return writer.records + writer.pendingRecords
@@ -1,7 +1,18 @@
+import sys
 from agents import RandomEnemyAgent
+from selfplay import SelfPlay
 import train
 
-agent = train.DataDumpAgent()
-trainer = train.Trainer([RandomEnemyAgent(1), RandomEnemyAgent(2)])
-trainer.train(agent, 100)
-agent.dump('dataset.json')
\ No newline at end of file
+# dump-dataset.py [episodes] [workers] [dataset.json] [seed], any other extension than .json writes a binary dataset
+episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else SelfPlay().workers
+filename = sys.argv[3] if len(sys.argv) > 3 else 'dataset.json'
+seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+
+if __name__ == '__main__':
+    enemyAgents = [RandomEnemyAgent(1), RandomEnemyAgent(2)]
+    if filename.endswith('.json'):
+        train.dumpDataset(SelfPlay(workers).generate(None, enemyAgents, episodes, seed), filename)
+    else:
+        records = SelfPlay(workers).generateFile(None, enemyAgents, episodes, filename, seed)
+        print(f"Dumped {records} records")
@@ -0,0 +1,12 @@
+import sys
+from cnn_inference import Quantization, calibration_boards, export_torchscript
+from dataset import loadDataset
+
+# python export-model.py [model.pth] [model.pt] [dynamic|static], loaded by ScriptedSnakeInference.
+# static quantization calibrates on the dataset.json written by dump-dataset.py
+modelPath = sys.argv[1] if len(sys.argv) > 1 else 'snake-model-1.pth'
+scriptedPath = sys.argv[2] if len(sys.argv) > 2 else 'snake-model-1.pt'
+quantization = sys.argv[3] if len(sys.argv) > 3 else None
+calibration = calibration_boards(loadDataset('dataset.json')) if quantization == Quantization.STATIC else None
+export_torchscript(scriptedPath, modelPath, quantization, calibration)
+print(f"Exported {modelPath} to {scriptedPath}" + (f" with {quantization} quantization" if quantization is not None else ""))
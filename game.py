@@ -1,12 +1,19 @@
 from __future__ import annotations
 import json
+import random
 from typing import Dict, List, Optional, Tuple
 import util
+from transposition import ZobristKeys
 
 class GameState:
-    def __init__(self, state: Dict) -> None:
+    # attributes that make up the serialized state, the rest is search bookkeeping
+    FIELDS = ('height', 'width', 'food', 'hazards', 'players', 'endState', 'won', 'lost', 'tie')
+
+    def __init__(self, state: Dict, ruleset: Optional[Ruleset] = None) -> None:
         self.height = int(state['board']['height'])
         self.width = int(state['board']['width'])
+        # copies share the ruleset of their game, new states read it from the request
+        self.ruleset = ruleset if ruleset is not None else Ruleset.forGame(state.get('game'))
         self.food = util.getCoordinates(state['board']['food'])
         self.hazards = util.getCoordinates(state['board']['hazards'])
         self.players: List[Player] = []
@@ -18,9 +25,12 @@ class GameState:
         for snake in state['board']['snakes']:
             if state['you']['id'] == snake['id']:
                 # make sure first player is us
-                self.players.insert(0, Player(snake, True))
+                self.players.insert(0, Player(snake, True, self.width, self.ruleset))
             else:
-                self.players.append(Player(snake, False))
+                self.players.append(Player(snake, False, self.width, self.ruleset))
+
+        self.zobrist = ZobristKeys.forBoard(self.width, self.height, len(self.players))
+        self.hash = self.zobrist.hashState(self)
         
     def isEndState(self) -> bool:
         return self.endState
@@ -42,6 +52,10 @@ class GameState:
     def getAlivePlayers(self) -> List[Player]:
         return [player for player in self.players if player.alive]
     
+    def rehash(self) -> None:
+        "Recomputes the position hash after the players were changed outside of makeMove"
+        self.hash = self.zobrist.hashState(self)
+
     def accountForEndState(self) -> None:
         if self.endState:
             # already accounted for
@@ -57,7 +71,7 @@ class GameState:
             self.endState = True
     
     def deepCopy(self) -> GameState:
-        return GameState({
+        copy = GameState({
             'board': {
                 'height': self.height,
                 'width': self.width,
@@ -74,54 +88,239 @@ class GameState:
             'you': {
                 'id': self.players[0].id if len(self.players) > 0 and self.players[0].ours else None
             }
-        })
+        }, self.ruleset)
+        copy.restoreStackedBodies([player.body for player in self.players])
+        return copy
+
+    def restoreStackedBodies(self, bodies: List[List[Tuple[int, int]]]) -> None:
+        "__init__ keeps each body cell once like in a request, copies of search states keep the segments that share a cell"
+        restored = False
+        for player, body in zip(self.players, bodies):
+            if len(set(body)) < len(body):
+                player.setBody(body)
+                restored = True
+        if restored:
+            self.rehash()
+    
+    def encode(self) -> Tuple:
+        "Compact form of the state made of ints and tuples, cheap to pickle to worker processes"
+        width = self.width
+        return (
+            self.width,
+            self.height,
+            tuple([y * width + x for (x, y) in self.food]),
+            tuple([y * width + x for (x, y) in self.hazards]),
+            tuple([(player.id, player.health, player.alive, player.ours, tuple([y * width + x for (x, y) in player.body])) for player in self.players]),
+            (self.ruleset.name, self.ruleset.hazardDamage),
+        )
+
+    def decode(data: Tuple) -> GameState:
+        width, height, food, hazards, players, (ruleset, hazardDamage) = data
+
+        def getDictCoordinates(cells: Tuple) -> List[Dict]:
+            return [{'x': cell % width, 'y': cell // width} for cell in cells]
+
+        gameState = GameState({
+            'board': {
+                'height': height,
+                'width': width,
+                'food': getDictCoordinates(food),
+                'hazards': getDictCoordinates(hazards),
+                'snakes': [{
+                    'health': health,
+                    'body': getDictCoordinates(body),
+                    'id': id,
+                    'alive': alive,
+                } for (id, health, alive, ours, body) in players],
+            },
+            'you': {
+                'id': players[0][0] if len(players) > 0 and players[0][3] else None
+            }
+        }, Ruleset.get(ruleset, hazardDamage))
+        gameState.restoreStackedBodies([[(cell % width, cell // width) for cell in body] for (id, health, alive, ours, body) in players])
+        return gameState
+    decode = staticmethod(decode)
     
     def generateSuccessor(self, action: Optional[str], playerIndex: int) -> GameState:
         nextState = self.deepCopy()
+        nextState.makeMove(action, playerIndex)
+
+        return nextState
+    
+    def makeMove(self, action: Optional[str], playerIndex: int, checkLegal: bool = True) -> Tuple:
+        """
+        In-place counterpart of generateSuccessor for the search agents. Applies
+        the move to this state and returns an undo entry which must be passed
+        back to unmakeMove (in LIFO order) to restore the exact prior state.
+        checkLegal can be turned off when the action came from getLegalActions.
+        """
+        player = self.players[playerIndex]
+        flags = (self.endState, self.won, self.lost, self.tie)
+        # generateSuccessor works on a fresh copy, which starts with the end state flags cleared
+        self.endState = self.won = self.lost = self.tie = False
+        head, health, length, alive = player.head, player.health, player.length, player.alive
+        bodyMask, stacked = player.bodyMask, player.stacked
+        hash = self.hash
+        tail = player.body[-1] if len(player.body) > 0 else None
+        newHead = None
+        foodIndex = -1
+        killed = None
 
-        # if(len(nextState.getAlivePlayers()) <= 1):
-        #     # game already over
-        #     return nextState
-        
-        player = nextState.players[playerIndex]
-        
         # if the player did an illegal move, eliminate the player
-        if action is None or action not in GameRules.getLegalActions(nextState, playerIndex) or not player.alive:
+        if action is None or not player.alive or (checkLegal and action not in GameRules.getLegalActions(self, playerIndex)):
             player.alive = False
         else:
-            player.move(action, nextState.width, nextState.height, nextState.food, nextState.hazards)
-            newx, newy = player.head
+            newHead = Actions.getSuccessor(action, player, self.width, self.height)
+            if newHead in self.food:
+                foodIndex = self.food.index(newHead)
+
+            player.move(action, self.width, self.height, self.food, self.hazards)
             playerHealth = player.health
-            
+
             # check head to head collision elimination
-            for i in range(len(nextState.players)):
+            for i in range(len(self.players)):
                 if i == playerIndex:
                     continue
 
-                curPlayer = nextState.players[i]
+                curPlayer = self.players[i]
 
                 if not curPlayer.alive:
                     continue
 
                 # Head to head collision
-                if curPlayer.head == (newx, newy):
+                if curPlayer.head == newHead:
                     # Eliminate the player with lower health
                     if curPlayer.health < playerHealth and i < playerIndex:
                         # cur player already played move and is of lower health, so dies
                         curPlayer.alive = False
-                        nextState.accountForEndState()
-                        if nextState.endState:
+                        killed = [i] if killed is None else killed + [i]
+                        self.accountForEndState()
+                        if self.endState:
                             break
                     else:
                         # either cur player is yet to play (head to body collision) or is higher health, so moving player dies
                         player.alive = False
                         break
 
+            # update the position hash with the new head, dropped tail, eaten food and health
+            keys = self.zobrist
+            width = self.width
+            newCell = newHead[1] * width + newHead[0]
+            headCell = head[1] * width + head[0]
+            # body cells are hashed once however many segments they hold, and the stacked count apart
+            self.hash = self.hash ^ keys.head[playerIndex][headCell] ^ keys.head[playerIndex][newCell]
+            if not (bodyMask >> newCell) & 1:
+                self.hash = self.hash ^ keys.body[playerIndex][newCell]
+            tailCell = tail[1] * width + tail[0]
+            if len(player.body) == length and not (player.bodyMask >> tailCell) & 1:
+                self.hash = self.hash ^ keys.body[playerIndex][tailCell]
+            if player.stacked != stacked:
+                self.hash = self.hash ^ keys.stacked[playerIndex][stacked] ^ keys.stacked[playerIndex][player.stacked]
+            if foodIndex >= 0 and newHead not in self.food:
+                self.hash = self.hash ^ keys.food[newCell]
+            self.hash = self.hash ^ keys.health[playerIndex][ZobristKeys.healthBucket(health)] ^ keys.health[playerIndex][ZobristKeys.healthBucket(player.health)]
+            if killed is not None:
+                for i in killed:
+                    self.hash = self.hash ^ keys.alive[i]
+
+        if player.alive != alive:
+            self.hash = self.hash ^ self.zobrist.alive[playerIndex]
+
         # end state accounting
-        nextState.accountForEndState()
+        self.accountForEndState()
+
+        return (playerIndex, head, health, length, alive, bodyMask, stacked, tail, newHead, foodIndex, killed, flags, hash)
+
+    def unmakeMove(self, undo: Tuple) -> None:
+        playerIndex, head, health, length, alive, bodyMask, stacked, tail, newHead, foodIndex, killed, flags, hash = undo
+        player = self.players[playerIndex]
+
+        if newHead is not None:
+            # take the new head off, then give back the truncated tail and the eaten food
+            del player.body[0]
+            if len(player.body) < length:
+                player.body.append(tail)
+            if foodIndex >= 0:
+                self.food.insert(foodIndex, newHead)
+
+        player.head, player.health, player.length, player.alive = head, health, length, alive
+        player.bodyMask, player.stacked = bodyMask, stacked
+
+        if killed is not None:
+            for i in killed:
+                self.players[i].alive = True
+
+        self.endState, self.won, self.lost, self.tie = flags
+        self.hash = hash
+
+    def makeJointMove(self, actions: List[Optional[str]]) -> Tuple:
+        """
+        Plays one move of every alive player at the same time, for the agents
+        that search joint moves. All heads move first, then the collisions are
+        settled together: a head on a body segment dies, and in a head to head
+        collision the player with less health dies, both with equal health.
+        Snakes meeting on a pellet both eat it. Returns an undo entry for
+        unmakeJointMove.
+        """
+        flags = (self.endState, self.won, self.lost, self.tie)
+        self.endState = self.won = self.lost = self.tie = False
+        food = list(self.food)
+        hash = self.hash
+        moveTable = self.ruleset.moveTable(self.width, self.height)
+        moved = []
+        saved = []
+        for i in range(len(self.players)):
+            player = self.players[i]
+            tail = player.body[-1] if len(player.body) > 0 else None
+            saved.append((player.head, player.health, player.length, player.alive, player.bodyMask, player.stacked, tail))
+            if not player.alive:
+                continue
+            x, y = player.head
+            if actions[i] not in moveTable[y * self.width + x]:
+                # no move or off the board
+                player.alive = False
+                continue
+            # every player sees the food of the start of the turn
+            player.move(actions[i], self.width, self.height, list(food), self.hazards)
+            moved.append(i)
+
+        eliminated = []
+        for i in moved:
+            player = self.players[i]
+            if not player.alive:
+                # starved
+                continue
+            for j in moved:
+                other = self.players[j]
+                if not other.alive:
+                    continue
+                if player.head in other.body[1:] or (j != i and other.head == player.head and other.health >= player.health):
+                    eliminated.append(i)
+                    break
+        for i in eliminated:
+            self.players[i].alive = False
+
+        heads = [self.players[i].head for i in moved]
+        self.food[:] = [cell for cell in food if cell not in heads]
+        self.rehash()
+        self.accountForEndState()
+        return (saved, moved, food, flags, hash)
+
+    def unmakeJointMove(self, undo: Tuple) -> None:
+        saved, moved, food, flags, hash = undo
+        for i in moved:
+            player = self.players[i]
+            length, tail = saved[i][2], saved[i][6]
+            del player.body[0]
+            if len(player.body) < length:
+                player.body.append(tail)
+        for i in range(len(self.players)):
+            player = self.players[i]
+            player.head, player.health, player.length, player.alive, player.bodyMask, player.stacked, _ = saved[i]
+        self.food[:] = food
+        self.endState, self.won, self.lost, self.tie = flags
+        self.hash = hash
 
-        return nextState
-    
     def getWalls(self) -> List[Tuple[int, int]]:
         walls = []
         for player in self.players:
@@ -130,6 +329,18 @@ class GameState:
             walls = walls + player.futureBody()
         
         return walls
+
+    def getWallMask(self) -> int:
+        "Bitboard equivalent of getWalls"
+        walls = 0
+        for player in self.players:
+            if player.alive:
+                walls = walls | player.futureMask()
+
+        return walls
+
+    def getFoodMask(self) -> int:
+        return util.getMask(self.food, self.width)
     
     def __repr__(self) -> str:
         return {
@@ -162,7 +373,9 @@ class Player:
     MAX_HEALTH = 100
     MIN_LENGTH = 3
     HAZARD_DAMAGE = 15
-    def __init__(self, player: Dict, ours: bool) -> None:
+    FIELDS = ('health', 'body', 'head', 'length', 'id', 'alive', 'ours')
+
+    def __init__(self, player: Dict, ours: bool, width: int, ruleset: Optional[Ruleset] = None) -> None:
         self.health = int(player['health'])
         # take unique while preserving order
         self.body = list(dict.fromkeys(util.getCoordinates(player['body'])))
@@ -174,6 +387,20 @@ class Player:
         else:
             self.alive = player['alive']
         self.ours = bool(ours)
+        # bitboard of the body cells (bit y * width + x), kept up to date by move
+        self.width = width
+        self.bodyMask = util.getMask(self.body, width)
+        # number of body segments sharing a cell with another segment
+        self.stacked = 0
+        self.ruleset = ruleset if ruleset is not None else Ruleset.get()
+
+    def setBody(self, body: List[Tuple[int, int]]) -> None:
+        "Replaces the body, which may have segments sharing a cell"
+        self.body = list(body)
+        self.head = self.body[0] if len(self.body) > 0 else None
+        self.length = len(self.body)
+        self.bodyMask = util.getMask(self.body, self.width)
+        self.stacked = len(self.body) - len(set(self.body))
 
     def move(self, action: str, width: int, height: int, food: List[Tuple[int, int]], hazards: List[Tuple[int, int]]) -> None:
         if not self.alive:
@@ -181,19 +408,31 @@ class Player:
 
         newHead = Actions.getSuccessor(action, self, width, height)
         self.body.insert(0, newHead)
+        headBit = 1 << (newHead[1] * width + newHead[0])
+        if self.bodyMask & headBit:
+            # moved onto our own tail
+            self.stacked = self.stacked + 1
+        self.bodyMask = self.bodyMask | headBit
         if newHead in food:
             # increase health to max if food is consumed
             self.health = Player.MAX_HEALTH
             food.remove(newHead)
+        elif self.ruleset.constrictor:
+            # constrictor snakes grow every turn and never starve
+            self.health = Player.MAX_HEALTH
         else:
             # truncate from tail if food not consumed
             if(len(self.body) > Player.MIN_LENGTH):
-                del self.body[len(self.body) - 1]
+                tail = self.body.pop()
+                if self.stacked > 0 and tail in self.body:
+                    self.stacked = self.stacked - 1
+                else:
+                    self.bodyMask = self.bodyMask & ~(1 << (tail[1] * width + tail[0]))
             self.health = self.health - 1
         
         # account for hazards
         if newHead in hazards:
-            self.health = self.health - Player.HAZARD_DAMAGE
+            self.health = self.health - self.ruleset.hazardDamage
 
         self.length = len(self.body)
         self.head = newHead
@@ -202,10 +441,19 @@ class Player:
             self.alive = False
 
     def futureBody(self) -> List[Tuple[int, int]]:
-        if len(self.body) <= Player.MIN_LENGTH:
+        if len(self.body) <= Player.MIN_LENGTH or self.ruleset.constrictor:
             return self.body
         else:
             return self.body[0:-1]
+
+    def futureMask(self) -> int:
+        "Bitboard equivalent of futureBody"
+        if self.stacked > 0:
+            return util.getMask(self.futureBody(), self.width)
+        if len(self.body) <= Player.MIN_LENGTH or self.ruleset.constrictor:
+            return self.bodyMask
+        x, y = self.body[-1]
+        return self.bodyMask & ~(1 << (y * self.width + x))
         
     def __repr__(self) -> str:
         return {
@@ -230,9 +478,60 @@ class Player:
         if not self.ours == other.ours: return False
         return True
 
-class GameRules:
-    WRAPPED = False
+class Ruleset:
+    """
+    Rules of one game mode, picked per game from the request's game.ruleset:
+    standard, wrapped (opposite edges connect), royale (hazards take
+    hazardDamage health per turn) and constrictor (snakes grow every turn).
+    Holds the move tables of the board sizes played under it.
+    """
+    STANDARD = 'standard'
+    WRAPPED = 'wrapped'
+    ROYALE = 'royale'
+    CONSTRICTOR = 'constrictor'
+
+    _rulesets: Dict[Tuple[str, int], Ruleset] = {}
+
+    def __init__(self, name: str = STANDARD, hazardDamage: int = Player.HAZARD_DAMAGE) -> None:
+        self.name = name
+        self.hazardDamage = hazardDamage
+        # combined modes like wrapped_constrictor have both rules
+        self.wrapped = Ruleset.WRAPPED in name
+        self.constrictor = Ruleset.CONSTRICTOR in name
+        # mixed into position hashes, so search results of games under other rules don't mix. 0 for the default rules
+        self.hashKey = 0 if (name, hazardDamage) == (Ruleset.STANDARD, Player.HAZARD_DAMAGE) else random.Random(f"{name}/{hazardDamage}").getrandbits(64)
+        self.moveTables: Dict[Tuple[int, int], List[Dict[str, int]]] = {}
+
+    def get(name: str = STANDARD, hazardDamage: int = Player.HAZARD_DAMAGE) -> Ruleset:
+        ruleset = (name, hazardDamage)
+        if ruleset not in Ruleset._rulesets:
+            Ruleset._rulesets[ruleset] = Ruleset(name, hazardDamage)
+        return Ruleset._rulesets[ruleset]
+    get = staticmethod(get)
+
+    def forGame(game: Optional[Dict]) -> Ruleset:
+        "Ruleset of the request's game object, standard if it has none"
+        ruleset = (game or {}).get('ruleset') or {}
+        settings = ruleset.get('settings') or {}
+        return Ruleset.get(ruleset.get('name') or Ruleset.STANDARD, int(settings.get('hazardDamagePerTurn', Player.HAZARD_DAMAGE)))
+    forGame = staticmethod(forGame)
+
+    def moveTable(self, width: int, height: int) -> List[Dict[str, int]]:
+        "The cell (y * width + x) each direction leads to, by cell, without the moves off the board"
+        board = (width, height)
+        if board not in self.moveTables:
+            table = []
+            for cell in range(width * height):
+                x, y = cell % width, cell // width
+                moves = {}
+                for direction, (dx, dy) in Actions._directionsAsList:
+                    if self.wrapped or (0 <= x + dx < width and 0 <= y + dy < height):
+                        moves[direction] = ((y + dy) % height) * width + (x + dx) % width
+                table.append(moves)
+            self.moveTables[board] = table
+        return self.moveTables[board]
 
+class GameRules:
     def getLegalActions(gameState: GameState, playerIndex: int) -> List[str]:
         return Actions.getPossibleActions(gameState.players, gameState.width, gameState.height, playerIndex)
     getLegalActions = staticmethod(getLegalActions)
@@ -266,6 +565,43 @@ class Actions:
     vectorToDirection = staticmethod(vectorToDirection)
 
     def getPossibleActions(players: List[Player], width: int, height: int, index: int = 0) -> List[str]:
+        player = players[index]
+        if not player.alive:
+            return []
+
+        # cells the moving player can't enter, as a bitboard
+        blocked = 0
+        for i in range(len(players)):
+            other = players[i]
+            if not other.alive:
+                continue
+            if other.stacked > 0:
+                # overlapping segments, fall back to the list based checks
+                return Actions.getPossibleActionsFromLists(players, width, height, index)
+            hx, hy = other.head
+            headBit = 1 << (hy * width + hx)
+            if i >= index:
+                # future body including the head
+                blocked = blocked | other.futureMask()
+            else:
+                # already moved: future body without the new head, plus the tail
+                tx, ty = other.body[-1]
+                blocked = blocked | (other.futureMask() & ~headBit) | (1 << (ty * width + tx))
+                if player.health <= other.health:
+                    # head to head collision with lower or equal health
+                    blocked = blocked | headBit
+
+        possible = []
+        x, y = player.head
+        # the table leaves out the moves off the board of unwrapped games
+        for direction, cell in player.ruleset.moveTable(width, height)[y * width + x].items():
+            if not (blocked >> cell) & 1:
+                possible.append(direction)
+
+        return possible
+    getPossibleActions = staticmethod(getPossibleActions)
+
+    def getPossibleActionsFromLists(players: List[Player], width: int, height: int, index: int = 0) -> List[str]:
         possible = []
         x, y = players[index].head
 
@@ -299,7 +635,7 @@ class Actions:
                     # head to head collision with lower or equal health
                     # i < index is to determine players that have already moved and their head position is the "next" head
                     break
-                if Actions.collidesWithBoundaries((x, y), vector, width, height):
+                if Actions.collidesWithBoundaries((x, y), vector, width, height, players[index].ruleset.wrapped):
                     # board boundaries for unwrapped games
                     break
                 # else:
@@ -308,7 +644,7 @@ class Actions:
                 possible.append(direction)
         
         return possible
-    getPossibleActions = staticmethod(getPossibleActions)
+    getPossibleActionsFromLists = staticmethod(getPossibleActionsFromLists)
 
     def getVerbosePossibleActions(players: List[Player], width: int, height: int, index: int = 0) -> List[str]:
         possible = []
@@ -347,7 +683,7 @@ class Actions:
                     # head to head collision with lower or equal health
                     # i < index is to determine players that have already moved and their head position is the "next" head
                     break
-                if Actions.collidesWithBoundaries((x, y), vector, width, height):
+                if Actions.collidesWithBoundaries((x, y), vector, width, height, players[index].ruleset.wrapped):
                     # board boundaries for unwrapped games
                     print(f"{nextx},{nexty} collides with boundaries")
                     break
@@ -359,11 +695,11 @@ class Actions:
         return possible
     getVerbosePossibleActions = staticmethod(getVerbosePossibleActions)
 
-    def collidesWithBoundaries(position: Tuple[int, int], vector: Tuple[int, int], width: int, height: int) -> bool:
+    def collidesWithBoundaries(position: Tuple[int, int], vector: Tuple[int, int], width: int, height: int, wrapped: bool = False) -> bool:
         x, y = position
         dx, dy = vector
 
-        if not GameRules.WRAPPED and ((x + dx) >= width or (y + dy) >= height or (x + dx) < 0 or (y + dy) < 0):
+        if not wrapped and ((x + dx) >= width or (y + dy) >= height or (x + dx) < 0 or (y + dy) < 0):
             return True
         
         return False
@@ -373,11 +709,11 @@ class Actions:
         if action not in Actions._directions:
             raise RuntimeError("Invalid action")
         
-        dx, dy = Actions._directions[action]
         x, y = player.head
+        cell = player.ruleset.moveTable(width, height)[y * width + x].get(action)
 
-        if Actions.collidesWithBoundaries((x, y), (dx, dy), width, height):
+        if cell is None:
             raise RuntimeError("Action collides with boundaries")
         
-        return ((x + dx) % width, (y + dy) % height)
+        return (cell % width, cell // width)
     getSuccessor = staticmethod(getSuccessor)
\ No newline at end of file
@@ -13,11 +13,40 @@
 import random
 import typing
 from game import GameState
-from agents import MinimaxAgent, RandomAgent, AlphaBetaAgent
+from agents import MinimaxAgent, RandomAgent, IterativeDeepeningAgent, MCTSAgent, SearchModes
+from parallel import SearchPool
 from server import get_server
+from session import GameSession, SessionStore
+from transposition import EvaluationCache
 import logging
 import os
 
+# time kept back from the game's move timeout for network latency and request handling
+LATENCY_MARGIN_MS = int(os.environ.get("LATENCY_MARGIN_MS", "150"))
+DEFAULT_TIMEOUT_MS = 500
+# how opponents are searched in multi-snake games, one of the SearchModes
+SEARCH_MODE = os.environ.get("SEARCH_MODE", SearchModes.PARANOID)
+MIN_SEARCH_MS = 10
+# 'alphabeta' or 'mcts'
+SEARCH_ALGORITHM = os.environ.get("SEARCH_ALGORITHM", "alphabeta")
+# worker processes for root-parallel search, 0 searches in the request thread
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "0"))
+# memory for the evaluation cache of each game (in every search process), 0 disables it
+EVAL_CACHE_MB = float(os.environ.get("EVAL_CACHE_MB", str(EvaluationCache.DEFAULT_MEGABYTES)))
+# weight of the Voronoi territory term of the alpha-beta evaluation, 0 leaves it out
+TERRITORY_WEIGHT = float(os.environ.get("TERRITORY_WEIGHT", str(MinimaxAgent.TERRITORY_WEIGHT)))
+# sessions of games without requests for this long are freed, for games that never send /end
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", str(SessionStore.IDLE_SECONDS)))
+
+# started with the server when SEARCH_WORKERS is set
+pool: typing.Optional[SearchPool] = None
+# search state kept across the turns of the games being played
+sessions = SessionStore(EVAL_CACHE_MB, SESSION_IDLE_SECONDS)
+
+def gameSession(game_state: typing.Dict) -> typing.Optional[GameSession]:
+    gameId = game_state.get("game", {}).get("id")
+    return sessions.get(gameId) if gameId is not None else None
+
 # info is called when you create your Battlesnake on play.battlesnake.com
 # and controls your Battlesnake's appearance
 # TIP: If you open your Battlesnake URL in a browser you should see this data
@@ -36,10 +65,15 @@ def info() -> typing.Dict:
 # start is called when your Battlesnake begins a game
 def start(game_state: typing.Dict):
     print(f"GAME START at {game_state['board']}")
+    gameSession(game_state)
 
 
 # end is called when your Battlesnake finishes a game
 def end(game_state: typing.Dict):
+    session = sessions.end(game_state.get("game", {}).get("id"))
+    cache = session.evaluationCache if session is not None else None
+    if cache is not None and cache.hits + cache.misses > 0:
+        print(f"evaluation cache {cache.getStats()}")
     print("GAME OVER\n")
 
 
@@ -49,8 +83,36 @@ def end(game_state: typing.Dict):
 def move(game_state: typing.Dict) -> typing.Dict:
     #print(f"State: {game_state}")
     state = GameState(game_state)
-    agent = AlphaBetaAgent(3)
-    recommendedMove = agent.getAction(state)
+    timeout = int(game_state.get("game", {}).get("timeout", DEFAULT_TIMEOUT_MS))
+    timeBudget = max(timeout - LATENCY_MARGIN_MS, MIN_SEARCH_MS) / 1000.0
+    session = gameSession(game_state)
+    if session is not None:
+        session.moves = session.moves + 1
+
+    if pool is not None and SEARCH_ALGORITHM == "mcts":
+        recommendedMove = pool.getMCTSAction(state, timeBudget)
+        print(f"MOVE {game_state.get('turn')}: {recommendedMove}, playouts {pool.nodes} on {pool.workers} workers")
+    elif pool is not None:
+        # the workers keep their own caches, the sessions here tell them which games are still played
+        gameId = session.gameId if session is not None else None
+        recommendedMove = pool.getAction(state, timeBudget, SEARCH_MODE, gameId, sessions.gameIds())
+        print(f"MOVE {game_state.get('turn')}: {recommendedMove}, depth {pool.depthReached}, nodes {pool.nodes} on {pool.workers} workers, "
+            f"evaluation cache hits {pool.cacheHits}/{pool.cacheHits + pool.cacheMisses}")
+    elif SEARCH_ALGORITHM == "mcts":
+        agent = session.mctsAgent(timeBudget) if session is not None else MCTSAgent(timeBudget)
+        recommendedMove = agent.getAction(state)
+        print(f"MOVE {game_state.get('turn')}: {recommendedMove}, playouts {agent.playouts}, reused {agent.reusedPlayouts}")
+    else:
+        if session is not None:
+            agent = session.alphaBetaAgent(timeBudget, SEARCH_MODE)
+        else:
+            agent = IterativeDeepeningAgent(timeBudget, searchMode=SEARCH_MODE)
+        agent.territoryWeight = TERRITORY_WEIGHT
+        hits, misses = (agent.evaluationCache.hits, agent.evaluationCache.misses) if agent.evaluationCache is not None else (0, 0)
+        recommendedMove = agent.getAction(state)
+        if agent.evaluationCache is not None:
+            hits, misses = agent.evaluationCache.hits - hits, agent.evaluationCache.misses - misses
+        print(f"MOVE {game_state.get('turn')}: {recommendedMove}, depth {agent.depthReached}, nodes {agent.nodes}, evaluation cache hits {hits}/{hits + misses}")
 
     return {"move": recommendedMove, "shout": ""}
 
@@ -110,5 +172,9 @@ if __name__ == "__main__":
 
     logging.getLogger("werkzeug").setLevel(logging.ERROR)
 
+    if SEARCH_WORKERS > 0:
+        print(f"Starting {SEARCH_WORKERS} search workers")
+        pool = SearchPool(SEARCH_WORKERS, EVAL_CACHE_MB, TERRITORY_WEIGHT)
+
     print(f"\nRunning Battlesnake at http://{host}:{port}")
     app.run(host=host, port=port)
@@ -0,0 +1,52 @@
+from typing import Dict, List, Optional, Tuple
+from game import GameState
+
+class MoveOrdering:
+    "Decides the order in which the search visits moves. The base class keeps the order of the legal moves."
+    def orderMoves(self, gameState: GameState, playerIndex: int, ply: int, moves: List[str], pvMove: Optional[str]) -> List[str]:
+        return moves
+
+    def recordCutoff(self, playerIndex: int, ply: int, move: str, depth: int) -> None:
+        pass
+
+    def newSearch(self) -> None:
+        pass
+
+class HeuristicMoveOrdering(MoveOrdering):
+    """
+    Tries the principal variation move first, then the killer moves of the ply,
+    then the rest by how often they caused cutoffs for the player (history).
+    """
+    KILLERS_PER_PLY = 2
+
+    def __init__(self) -> None:
+        self.killers: Dict[int, List[str]] = {}
+        self.history: Dict[Tuple[int, str], int] = {}
+
+    def orderMoves(self, gameState: GameState, playerIndex: int, ply: int, moves: List[str], pvMove: Optional[str]) -> List[str]:
+        if len(moves) <= 1:
+            return moves
+
+        killers = self.killers.get(ply, [])
+
+        def score(move: str) -> Tuple[bool, int, int]:
+            killerRank = HeuristicMoveOrdering.KILLERS_PER_PLY - killers.index(move) if move in killers else 0
+            return (move == pvMove, killerRank, self.history.get((playerIndex, move), 0))
+
+        return sorted(moves, key=score, reverse=True)
+
+    def recordCutoff(self, playerIndex: int, ply: int, move: str, depth: int) -> None:
+        killers = self.killers.setdefault(ply, [])
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[HeuristicMoveOrdering.KILLERS_PER_PLY:]
+
+        # cutoffs close to the root prune the most, so they weigh more
+        self.history[(playerIndex, move)] = self.history.get((playerIndex, move), 0) + depth * depth
+
+    def newSearch(self) -> None:
+        # killers are relative to the root, history is kept but aged
+        self.killers = {}
+        for key in self.history:
+            self.history[key] = self.history[key] // 2
@@ -0,0 +1,154 @@
+import multiprocessing
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from agents import IterativeDeepeningAgent, MCTSAgent, MinimaxAgent, SearchModes
+from game import GameState
+from transposition import EvaluationCache
+
+# per worker process agent, so its transposition table and history survive between requests
+_agent: Optional[IterativeDeepeningAgent] = None
+# the worker's evaluation caches of the games being played, by game id
+_caches: Dict[str, EvaluationCache] = {}
+_cacheMegabytes = 0.0
+
+def _initWorker(cacheMegabytes: float, territoryWeight: float) -> None:
+    global _agent, _cacheMegabytes
+    _agent = IterativeDeepeningAgent(0.0)
+    _agent.territoryWeight = territoryWeight
+    _cacheMegabytes = cacheMegabytes
+
+def _gameCache(gameId: Optional[str], activeGames: Tuple[str, ...]) -> Optional[EvaluationCache]:
+    # the games that ended since the last task are dropped
+    for ended in [game for game in _caches if game not in activeGames]:
+        del _caches[ended]
+    if _cacheMegabytes <= 0 or gameId is None:
+        return None
+    if gameId not in _caches:
+        _caches[gameId] = EvaluationCache.forMemory(_cacheMegabytes)
+    return _caches[gameId]
+
+def _warmUp(_: int) -> bool:
+    return _agent is not None
+
+def _searchMove(encodedState: Tuple, move: str, deadline: float, searchMode: str, gameId: Optional[str], activeGames: Tuple[str, ...]) -> Tuple[str, List[float], bool, int, int, int]:
+    """
+    Deepens the search below one of our root moves until the deadline
+    (time.monotonic, shared by all processes). Returns the value of every
+    completed depth and whether the last one decided the game.
+    """
+    cache = _gameCache(gameId, activeGames)
+    _agent.timeBudget = deadline - time.monotonic()
+    if _agent.timeBudget <= 0:
+        return (move, [], False, 0, 0, 0)
+
+    _agent.searchMode = searchMode
+    _agent.evaluationCache = cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    _agent.evaluateMove(GameState.decode(encodedState), move)
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return (move, _agent.depthValues, _agent.decided, _agent.nodes, hits, misses)
+
+def _searchTree(encodedState: Tuple, deadline: float) -> Tuple[List[Optional[str]], List[int], int]:
+    "Grows an independent MCTS tree until the deadline and returns our root visit counts"
+    timeBudget = deadline - time.monotonic()
+    if timeBudget <= 0:
+        return ([], [], 0)
+
+    agent = MCTSAgent(timeBudget)
+    agent.getAction(GameState.decode(encodedState))
+    return (agent.root.actions[0], agent.root.visits[0], agent.playouts)
+
+class SearchPool:
+    """
+    Persistent pool of search processes for root-parallel search. Alpha-beta
+    splits our legal moves across the workers, MCTS grows one tree per worker
+    and sums the root visits. States are shipped as GameState.encode tuples.
+    """
+    # kept back from the budget for shipping the results back
+    COLLECT_MARGIN = 0.025
+
+    def __init__(self, workers: int, cacheMegabytes: float = 0.0, territoryWeight: float = MinimaxAgent.TERRITORY_WEIGHT) -> None:
+        self.workers = workers
+        # each worker keeps an evaluation cache of this size per game, 0 disables them
+        self.pool = multiprocessing.Pool(workers, initializer=_initWorker, initargs=(cacheMegabytes, territoryWeight))
+        self.depthReached = 0
+        self.nodes = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        # start all the processes (and their imports) before the first request
+        self.pool.map(_warmUp, range(workers))
+
+    def getAction(self, gameState: GameState, timeBudget: float, searchMode: str = SearchModes.PARANOID, gameId: Optional[str] = None, activeGames: Tuple[str, ...] = ()) -> Optional[str]:
+        "gameId picks the workers' evaluation caches, those of games not in activeGames are dropped"
+        self.depthReached = 0
+        self.nodes = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        legalMoves = gameState.getLegalActions()
+        if len(legalMoves) <= 1:
+            return legalMoves[0] if len(legalMoves) > 0 else None
+
+        deadline = time.monotonic() + timeBudget
+        encodedState = gameState.encode()
+        pending = [self.pool.apply_async(_searchMove, (encodedState, move, deadline - SearchPool.COLLECT_MARGIN, searchMode, gameId, activeGames)) for move in legalMoves]
+
+        depthValues: Dict[str, List[float]] = {}
+        decided: Dict[str, bool] = {}
+        for result in self.collect(pending, deadline):
+            move, moveValues, moveDecided, nodes, hits, misses = result
+            self.nodes = self.nodes + nodes
+            self.cacheHits = self.cacheHits + hits
+            self.cacheMisses = self.cacheMisses + misses
+            if len(moveValues) > 0:
+                depthValues[move] = moveValues
+                decided[move] = moveDecided
+
+        if len(depthValues) == 0:
+            return random.choice(legalMoves)
+
+        # the moves deepen independently, and values lose about a health point per ply, so they are
+        # compared at the deepest depth all of them completed. Decided moves keep their value at any depth
+        undecided = [len(depthValues[move]) for move in depthValues if not decided[move]]
+        self.depthReached = min(undecided) if len(undecided) > 0 else max(len(moveValues) for moveValues in depthValues.values())
+        values = {move: moveValues[min(self.depthReached, len(moveValues)) - 1] for move, moveValues in depthValues.items()}
+
+        bestValue = max(values.values())
+        return random.choice([move for move in values if values[move] == bestValue])
+
+    def getMCTSAction(self, gameState: GameState, timeBudget: float) -> Optional[str]:
+        self.nodes = 0
+        legalMoves = gameState.getLegalActions()
+        if len(legalMoves) <= 1:
+            return legalMoves[0] if len(legalMoves) > 0 else None
+
+        deadline = time.monotonic() + timeBudget
+        encodedState = gameState.encode()
+        pending = [self.pool.apply_async(_searchTree, (encodedState, deadline - SearchPool.COLLECT_MARGIN)) for _ in range(self.workers)]
+
+        visits: Dict[str, int] = {}
+        for result in self.collect(pending, deadline):
+            actions, counts, playouts = result
+            self.nodes = self.nodes + playouts
+            for action, count in zip(actions, counts):
+                if action is not None:
+                    visits[action] = visits.get(action, 0) + count
+
+        if len(visits) == 0:
+            return random.choice(legalMoves)
+
+        return max(visits, key=visits.get)
+
+    def collect(self, pending: List, deadline: float) -> List:
+        "Results that arrived before the deadline, late ones are dropped"
+        results = []
+        for result in pending:
+            try:
+                results.append(result.get(max(deadline - time.monotonic(), 0)))
+            except multiprocessing.TimeoutError:
+                pass
+        return results
+
+    def close(self) -> None:
+        self.pool.terminate()
@@ -0,0 +1,14 @@
+import sys
+from cnn_dataset import preprocess_dataset
+
+# preprocess-dataset.py [dataset.json] [directory] [pooled] [uint8|float16], encodes a JSON or binary dataset once into the
+# memory-mapped arrays train-model.py reads from a directory, at the native board sizes for pooled models, else padded to 32x32
+source = sys.argv[1] if len(sys.argv) > 1 else 'dataset.json'
+directory = sys.argv[2] if len(sys.argv) > 2 else 'dataset-encoded'
+pooled = len(sys.argv) > 3 and sys.argv[3] == 'pooled'
+dtype = sys.argv[4] if len(sys.argv) > 4 else 'uint8'
+
+counts = preprocess_dataset(source, directory, native=pooled, dtype=dtype)
+for (rows, cols), count in counts.items():
+    print(f"{rows}x{cols}: {count} records")
+print(f"Encoded {sum(counts.values())} records from {source} into {directory}")
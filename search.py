@@ -1,4 +1,6 @@
-from typing import List, Optional, Tuple
+from __future__ import annotations
+import threading
+from typing import Dict, List, Optional, Tuple
 
 class Queue:
     "A container with a first-in-first-out (FIFO) queuing policy."
@@ -20,7 +22,8 @@ class Queue:
         "Returns true if the queue is empty"
         return len(self.list) == 0
 
-def minDistanceToFoodBfs(startX, startY, food: List[Tuple[int, int]], walls: List[Tuple[int, int]], width: int, height: int):
+def minDistanceToFoodBfsWithQueue(startX, startY, foodMask: int, wallMask: int, width: int, height: int):
+    "Original BFS of minDistanceToFoodBfs, kept for comparison. food and walls are bitboards with bit y * width + x set for each occupied cell"
     visited = [[False for _ in range(height)] for _ in range(width)]
     queue = Queue()
     queue.push((startX, startY, 0))
@@ -30,14 +33,208 @@ def minDistanceToFoodBfs(startX, startY, food: List[Tuple[int, int]], walls: Lis
         x, y, dist = queue.pop()
         visited[x][y] = True
 
-        if((x, y) in food):
+        if (foodMask >> (y * width + x)) & 1:
             return dist
         
         for dx, dy in dpos:
             newx = x + dx
             newy = y + dy
 
-            if newx >= 0 and newx < width and newy >= 0 and newy < height and (not visited[newx][newy]) and ((newx, newy) not in walls):
+            if newx >= 0 and newx < width and newy >= 0 and newy < height and (not visited[newx][newy]) and not (wallMask >> (newy * width + newx)) & 1:
                 queue.push((newx, newy, dist + 1))
     
-    return -1
\ No newline at end of file
+    return -1
+
+class BfsBuffers(threading.local):
+    "Visited marks, queue and last search number of one thread, reused by all of its searches on a board size"
+    def __init__(self, cells: int) -> None:
+        self.marks = [0] * cells
+        self.queue = [0] * cells
+        self.stamp = 0
+
+class GridBfs:
+    """
+    Breadth first search over the flat cells (y * width + x) of one board size.
+    One instance per board size is shared by all threads: the neighbor table
+    and masks are read-only, the visited marks and queue are BfsBuffers of the
+    calling thread. Marks are stamped with a search number instead of cleared.
+    Cells are marked when queued, so each is queued at most once. Territory
+    grows all the snakes at once a whole distance layer at a time on bitboards.
+    """
+    _boards: Dict[Tuple[int, int], GridBfs] = {}
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        cells = width * height
+        self.neighbors: List[Tuple[int, ...]] = []
+        for cell in range(cells):
+            x, y = cell % width, cell // width
+            self.neighbors.append(tuple(ny * width + nx for (nx, ny) in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)] if 0 <= nx < width and 0 <= ny < height))
+        self.buffers = BfsBuffers(cells)
+        # bitboards of the whole board and of the cells that can shift a column right or left
+        self.fullMask = (1 << cells) - 1
+        firstColumn = sum(1 << (y * width) for y in range(height))
+        self.notLastColumnMask = self.fullMask & ~(firstColumn << (width - 1))
+        self.notFirstColumnMask = self.fullMask & ~firstColumn
+
+    def forBoard(width: int, height: int) -> GridBfs:
+        board = (width, height)
+        if board not in GridBfs._boards:
+            GridBfs._boards[board] = GridBfs(width, height)
+        return GridBfs._boards[board]
+    forBoard = staticmethod(forBoard)
+
+    def minDistance(self, start: int, targetMask: int, wallMask: int) -> int:
+        "Distance from start to the closest target cell that is not a wall, -1 if none is reachable"
+        if (targetMask >> start) & 1:
+            return 0
+        buffers = self.buffers
+        buffers.stamp = stamp = buffers.stamp + 1
+        marks, queue, neighbors = buffers.marks, buffers.queue, self.neighbors
+        marks[start] = stamp
+        queue[0] = start
+        head, tail = 0, 1
+        # the queue holds one distance layer after the other
+        distance, layerEnd = 1, 1
+        while head < tail:
+            if head == layerEnd:
+                distance, layerEnd = distance + 1, tail
+            cell = queue[head]
+            head = head + 1
+            for neighbor in neighbors[cell]:
+                if marks[neighbor] != stamp:
+                    marks[neighbor] = stamp
+                    bit = 1 << neighbor
+                    if not wallMask & bit:
+                        if targetMask & bit:
+                            return distance
+                        queue[tail] = neighbor
+                        tail = tail + 1
+        return -1
+
+    def distances(self, start: int, targetMask: int, wallMask: int) -> Dict[int, int]:
+        "Distance from start to each reachable target cell, the search stops once all targets are found"
+        found: Dict[int, int] = {}
+        remaining = targetMask
+        if (remaining >> start) & 1:
+            found[start] = 0
+            remaining = remaining & ~(1 << start)
+        if remaining == 0:
+            return found
+        buffers = self.buffers
+        buffers.stamp = stamp = buffers.stamp + 1
+        marks, queue, neighbors = buffers.marks, buffers.queue, self.neighbors
+        marks[start] = stamp
+        queue[0] = start
+        head, tail = 0, 1
+        distance, layerEnd = 1, 1
+        while head < tail:
+            if head == layerEnd:
+                distance, layerEnd = distance + 1, tail
+            cell = queue[head]
+            head = head + 1
+            for neighbor in neighbors[cell]:
+                if marks[neighbor] != stamp:
+                    marks[neighbor] = stamp
+                    bit = 1 << neighbor
+                    if not wallMask & bit:
+                        if remaining & bit:
+                            found[neighbor] = distance
+                            remaining = remaining & ~bit
+                            if remaining == 0:
+                                return found
+                        queue[tail] = neighbor
+                        tail = tail + 1
+        return found
+
+    def territory(self, players: List) -> List[int]:
+        """
+        Voronoi territory: number of cells each alive player reaches before all
+        others, by player index. Body segments block until they have moved off,
+        which takes as many turns as there are segments behind them. Cells
+        reached at the same time go to the longest snake, or no one on equal lengths.
+        """
+        width = self.width
+        notLast, notFirst = self.notLastColumnMask, self.notFirstColumnMask
+        counts = [0] * len(players)
+        regions = [0] * len(players)
+        lengths = [0] * len(players)
+        releases: Dict[int, int] = {}
+        blocked = 0
+        taken = 0
+        for i in range(len(players)):
+            player = players[i]
+            if not player.alive or player.head is None:
+                continue
+            body = player.body
+            # stacked segments are in the body twice, so it already has the full length
+            lengths[i] = len(body)
+            x, y = player.head
+            regions[i] = 1 << (y * width + x)
+            occupied = regions[i]
+            for k in range(1, len(body)):
+                x, y = body[k]
+                bit = 1 << (y * width + x)
+                if occupied & bit:
+                    # the first of the segments sharing a cell is the last to leave it
+                    continue
+                occupied = occupied | bit
+                turns = lengths[i] - k
+                releases[turns] = releases.get(turns, 0) | bit
+                blocked = blocked | bit
+            taken = taken | regions[i]
+
+        growing = [i for i in range(len(players)) if regions[i] != 0]
+        free = self.fullMask & ~blocked & ~taken
+        releaseTurns = sorted(releases)
+        lastRelease = releaseTurns[-1] if len(releaseTurns) > 0 else 0
+        turn = 0
+        grown = True
+        while grown or turn < lastRelease:
+            # once every region is enclosed only the next release can change anything
+            turn = turn + 1 if grown else next(t for t in releaseTurns if t > turn)
+            if turn in releases:
+                free = free | (releases[turn] & ~taken)
+
+            reached = []
+            once = twice = 0
+            for i in growing:
+                region = regions[i]
+                cells = (((region & notLast) << 1) | ((region & notFirst) >> 1) | (region << width) | (region >> width)) & free
+                reached.append(cells)
+                twice = twice | (once & cells)
+                once = once | cells
+
+            grown = False
+            for n in range(len(growing)):
+                cells = reached[n]
+                won = cells & ~twice
+                if cells & twice:
+                    i = growing[n]
+                    shared = cells & twice
+                    for m in range(len(growing)):
+                        if m != n and lengths[growing[m]] >= lengths[i]:
+                            shared = shared & ~reached[m]
+                    won = won | shared
+                if won:
+                    regions[growing[n]] = regions[growing[n]] | won
+                    counts[growing[n]] = counts[growing[n]] + won.bit_count()
+                    grown = True
+            free = free & ~once
+            taken = taken | once
+
+        return counts
+
+def minDistanceToFoodBfs(startX: int, startY: int, foodMask: int, wallMask: int, width: int, height: int) -> int:
+    "food and walls are bitboards with bit y * width + x set for each occupied cell, -1 if no food is reachable"
+    return GridBfs.forBoard(width, height).minDistance(startY * width + startX, foodMask, wallMask)
+
+def foodDistancesBfs(startX: int, startY: int, foodMask: int, wallMask: int, width: int, height: int) -> Dict[Tuple[int, int], int]:
+    "Distance to every reachable food, by food coordinates"
+    distances = GridBfs.forBoard(width, height).distances(startY * width + startX, foodMask, wallMask)
+    return {(cell % width, cell // width): distance for cell, distance in distances.items()}
+
+def voronoiTerritory(gameState) -> List[int]:
+    "Cells each player reaches first, see GridBfs.territory"
+    return GridBfs.forBoard(gameState.width, gameState.height).territory(gameState.players)
@@ -0,0 +1,83 @@
+import io
+import json
+import multiprocessing
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from agents import Agent, CustomEncoder
+from dataset import DatasetWriter
+from train import DataDumpAgent, Trainer
+
+def _playShard(agent: Optional[Agent], enemyAgents: List[Agent], episodes: int, seed: int, width: int, height: int, binary: bool) -> Tuple[Any, int, int]:
+    """
+    Plays one shard of episodes with its own seeded RNGs. Returns its records
+    as JSON or as binary dataset chunks, their number and the number of moves
+    """
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    # either is much smaller to ship back than pickled game states with their hashing tables
+    chunks = io.BytesIO()
+    recorder = DataDumpAgent(agent, DatasetWriter(chunks, header=False) if binary else None)
+    trainer = Trainer(enemyAgents, width, height, verbose=False)
+    trainer.train(recorder, episodes)
+    if binary:
+        recorder.writer.endEpisode()
+        return (chunks.getvalue(), recorder.writer.records, trainer.numMoves)
+    return (json.dumps(recorder.dataset, cls=CustomEncoder), len(recorder.dataset), trainer.numMoves)
+
+def _playShardArgs(shard: Tuple) -> Tuple[Any, int, int]:
+    return _playShard(*shard)
+
+class SelfPlay:
+    """
+    Generates Trainer datasets on a pool of processes. Episodes are split into
+    shards of SHARD_EPISODES, each played with RNGs seeded from the seed and the
+    shard number, and the records are merged in shard order. The dataset only
+    depends on the seed, not on the number of workers. The agents are pickled
+    to the workers, our snake plays random legal moves if agent is None.
+    """
+    SHARD_EPISODES = 5
+
+    def __init__(self, workers: int = os.cpu_count() or 1) -> None:
+        self.workers = workers
+        self.episodes = 0
+        self.moves = 0
+        self.elapsed = 0.0
+
+    def generate(self, agent: Optional[Agent], enemyAgents: List[Agent], episodes: int, seed: int = 0, width: int = 11, height: int = 11) -> List[Dict]:
+        "The records of the episodes, as loaded from a JSON dataset"
+        dataset = []
+        for records, _ in self.play(agent, enemyAgents, episodes, seed, width, height, False):
+            dataset.extend(json.loads(records))
+        return dataset
+
+    def generateFile(self, agent: Optional[Agent], enemyAgents: List[Agent], episodes: int, filename: str, seed: int = 0, width: int = 11, height: int = 11) -> int:
+        "Streams the records of the episodes to a binary dataset as the shards finish, returns the number of records"
+        with DatasetWriter.toFile(filename) as writer:
+            for chunks, records in self.play(agent, enemyAgents, episodes, seed, width, height, True):
+                writer.writeChunks(chunks, records)
+            return writer.records
+
+    def play(self, agent: Optional[Agent], enemyAgents: List[Agent], episodes: int, seed: int, width: int, height: int, binary: bool) -> Iterator[Tuple[Any, int]]:
+        "The records of each shard and their number, in shard order"
+        shards = [(agent, enemyAgents, min(SelfPlay.SHARD_EPISODES, episodes - first), seed * 1000003 + first, width, height, binary)
+            for first in range(0, episodes, SelfPlay.SHARD_EPISODES)]
+
+        start = time.perf_counter()
+        moves = 0
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            # one shard at a time and in order, so that the workers stay busy and the records can be written as they come
+            results = pool.imap(_playShardArgs, shards, chunksize=1) if pool is not None else map(_playShardArgs, shards)
+            for records, count, shardMoves in results:
+                moves = moves + shardMoves
+                yield (records, count)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        self.episodes, self.moves, self.elapsed = episodes, moves, time.perf_counter() - start
+        print(f"{episodes} episodes, {moves} moves in {self.elapsed:.1f}s on {self.workers} workers: "
+            f"{episodes / self.elapsed:.1f} episodes/s, {moves / self.elapsed:.0f} moves/s")
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from agents import IterativeDeepeningAgent, MCTSAgent, SearchModes
+from transposition import EvaluationCache
+
+class GameSession:
+    """
+    Search state of one game kept between its /move requests: the alpha-beta
+    agent with its transposition table and move ordering history, the MCTS
+    agent with the tree below the moves actually played and the evaluation cache.
+    """
+    def __init__(self, gameId: str, cacheMegabytes: float = 0.0) -> None:
+        self.gameId = gameId
+        # the agents are created by the first move that searches with them
+        self.alphaBeta: Optional[IterativeDeepeningAgent] = None
+        self.mcts: Optional[MCTSAgent] = None
+        self.evaluationCache = EvaluationCache.forMemory(cacheMegabytes) if cacheMegabytes > 0 else None
+        self.lastUsed = time.monotonic()
+        self.moves = 0
+
+    def alphaBetaAgent(self, timeBudget: float, searchMode: str = SearchModes.PARANOID) -> IterativeDeepeningAgent:
+        if self.alphaBeta is None:
+            self.alphaBeta = IterativeDeepeningAgent(timeBudget, searchMode=searchMode)
+            self.alphaBeta.evaluationCache = self.evaluationCache
+        self.alphaBeta.timeBudget = timeBudget
+        self.alphaBeta.searchMode = searchMode
+        return self.alphaBeta
+
+    def mctsAgent(self, timeBudget: float) -> MCTSAgent:
+        if self.mcts is None:
+            self.mcts = MCTSAgent(timeBudget)
+            self.mcts.reuseTree = True
+        self.mcts.timeBudget = timeBudget
+        return self.mcts
+
+class SessionStore:
+    """
+    Game sessions by game id, created on /start, reused by /move and freed on
+    /end. Games that stop sending requests without an /end are evicted once
+    idle for idleSeconds, and the least recently used ones beyond maxSessions.
+    """
+    IDLE_SECONDS = 300.0
+    MAX_SESSIONS = 32
+
+    def __init__(self, cacheMegabytes: float = 0.0, idleSeconds: float = IDLE_SECONDS, maxSessions: int = MAX_SESSIONS) -> None:
+        self.cacheMegabytes = cacheMegabytes
+        self.idleSeconds = idleSeconds
+        self.maxSessions = maxSessions
+        self.sessions: OrderedDict[str, GameSession] = OrderedDict()
+        # the server handles the requests of different games on their own threads
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, gameId: str) -> GameSession:
+        "The game's session, created if the game has none yet"
+        with self.lock:
+            now = time.monotonic()
+            self.evictIdle(now)
+            session = self.sessions.get(gameId)
+            if session is None:
+                session = GameSession(gameId, self.cacheMegabytes)
+                self.sessions[gameId] = session
+            self.sessions.move_to_end(gameId)
+            session.lastUsed = now
+            while len(self.sessions) > self.maxSessions:
+                self.evict(next(iter(self.sessions)))
+            return session
+
+    def end(self, gameId: str) -> Optional[GameSession]:
+        with self.lock:
+            return self.sessions.pop(gameId, None)
+
+    def evictIdle(self, now: float) -> None:
+        # least recently used first, so the idle ones are at the front
+        while len(self.sessions) > 0:
+            gameId, session = next(iter(self.sessions.items()))
+            if now - session.lastUsed <= self.idleSeconds:
+                break
+            self.evict(gameId)
+
+    def evict(self, gameId: str) -> None:
+        session = self.sessions.pop(gameId)
+        self.evictions = self.evictions + 1
+        print(f"evicted session of game {gameId} after {session.moves} moves")
+
+    def gameIds(self) -> Tuple[str, ...]:
+        with self.lock:
+            return tuple(self.sessions.keys())
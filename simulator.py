@@ -0,0 +1,197 @@
+import numpy as np
+from typing import Optional
+from game import Actions, GameState, Player, Ruleset
+
+class BatchSimulator:
+    """
+    Many games under the Trainer's rules stepped in lockstep with NumPy. Every
+    array has the games as its first axis: bodies as ring buffers of flat cells
+    (y * width + x) with the head at start, per player occupancy grids, health,
+    lengths, alive flags and food counts per cell. Within a turn the players
+    move one after the other like in Trainer.train, each checked against the
+    players that already moved like GameRules.getLegalActions, and a player
+    with no or an illegal move is eliminated. Food is topped up to one pellet
+    per alive player after every turn, on free cells.
+    """
+    # action ids index this list
+    DIRECTIONS = [direction for direction, _ in Actions._directionsAsList]
+    NO_MOVE = -1
+
+    def __init__(self, games: int, numPlayers: int, width: int = 11, height: int = 11, seed: Optional[int] = None) -> None:
+        self.games = games
+        self.numPlayers = numPlayers
+        self.width = width
+        self.height = height
+        self.cells = cells = width * height
+        self.rng = np.random.default_rng(seed)
+
+        # target cell of every action from every cell, -1 off the board
+        table = Ruleset.get().moveTable(width, height)
+        self.moveTable = np.array([[table[cell].get(direction, -1) for direction in BatchSimulator.DIRECTIONS] for cell in range(cells)], dtype=np.int64)
+
+        self.ring = np.zeros((games, numPlayers, cells), dtype=np.int16)
+        self.start = np.zeros((games, numPlayers), dtype=np.int64)
+        self.length = np.zeros((games, numPlayers), dtype=np.int64)
+        # head and tail cells, kept next to the ring buffers
+        self.heads = np.zeros((games, numPlayers), dtype=np.int64)
+        self.tails = np.zeros((games, numPlayers), dtype=np.int64)
+        self.occupied = np.zeros((games, numPlayers, cells), dtype=bool)
+        self.health = np.zeros((games, numPlayers), dtype=np.int64)
+        self.alive = np.zeros((games, numPlayers), dtype=bool)
+        self.food = np.zeros((games, cells), dtype=np.uint8)
+        self.turns = np.zeros(games, dtype=np.int64)
+        self.won = np.zeros(games, dtype=bool)
+        self.lost = np.zeros(games, dtype=bool)
+        self.tie = np.zeros(games, dtype=bool)
+        self.done = np.zeros(games, dtype=bool)
+        self.reset()
+
+    def reset(self, games: Optional[np.ndarray] = None) -> None:
+        "Starts new games (all by default) like GameSimulator.getRandomGameState: length 1 snakes on distinct random cells"
+        games = np.arange(self.games) if games is None else np.asarray(games)
+        if len(games) == 0:
+            return
+        players = np.arange(self.numPlayers)
+        starts = np.argpartition(self.rng.random((len(games), self.cells)), self.numPlayers - 1, axis=1)[:, :self.numPlayers]
+
+        self.ring[games] = 0
+        self.ring[games, :, 0] = starts
+        self.start[games] = 0
+        self.length[games] = 1
+        self.heads[games] = starts
+        self.tails[games] = starts
+        self.occupied[games] = False
+        self.occupied[games[:, None], players, starts] = True
+        self.health[games] = Player.MAX_HEALTH
+        self.alive[games] = True
+        self.food[games] = 0
+        self.turns[games] = 0
+        self.won[games] = self.lost[games] = self.tie[games] = self.done[games] = False
+        self.spawnFood(games)
+
+    def legalMoves(self, player: int, games: np.ndarray) -> np.ndarray:
+        "(games, 4) mask of the legal actions of player in the given games, at this point of the turn"
+        heads, tails = self.heads, self.tails
+        targets = self.moveTable[heads[games, player]]
+        onBoard = targets >= 0
+        targets = np.where(onBoard, targets, 0)
+        health = self.health[games, player][:, None]
+        blocked = np.zeros(targets.shape, dtype=bool)
+        for i in range(self.numPlayers):
+            occupied = self.occupied[games[:, None], i, targets]
+            if i >= player:
+                # yet to move: the whole body, less the tail that moves on unless the snake is still growing
+                movingTail = (targets == tails[games, i][:, None]) & (self.length[games, i] > Player.MIN_LENGTH)[:, None]
+                collides = occupied & ~movingTail
+            else:
+                # already moved: the body behind the new head, and the head itself unless we are healthier
+                head = heads[games, i][:, None]
+                collides = (occupied & (targets != head)) | ((targets == head) & (health <= self.health[games, i][:, None]))
+            blocked = blocked | (collides & self.alive[games, i][:, None])
+        return onBoard & ~blocked
+
+    def randomMoves(self, legal: np.ndarray) -> np.ndarray:
+        "A uniformly random legal action per row of the mask, NO_MOVE where there is none"
+        keys = np.where(legal, self.rng.random(legal.shape), -1.0)
+        actions = np.argmax(keys, axis=1)
+        return np.where(legal.any(axis=1), actions, BatchSimulator.NO_MOVE)
+
+    def move(self, player: int, games: np.ndarray, actions: np.ndarray, legal: np.ndarray) -> None:
+        "Applies one action per game for player, like Player.move. legal is the player's legalMoves mask"
+        rows = np.arange(len(games))
+        valid = (actions >= 0) & legal[rows, np.maximum(actions, 0)]
+        self.alive[games[~valid], player] = False
+        games, actions = games[valid], actions[valid]
+        if len(games) == 0:
+            return
+
+        targets = self.moveTable[self.heads[games, player], actions]
+        self.start[games, player] = (self.start[games, player] - 1) % self.cells
+        self.ring[games, player, self.start[games, player]] = targets
+        self.length[games, player] = self.length[games, player] + 1
+        self.heads[games, player] = targets
+        self.occupied[games, player, targets] = True
+
+        ate = self.food[games, targets] > 0
+        self.food[games[ate], targets[ate]] = self.food[games[ate], targets[ate]] - 1
+        self.health[games[ate], player] = Player.MAX_HEALTH
+
+        hungry, hungryTargets = games[~ate], targets[~ate]
+        self.health[hungry, player] = self.health[hungry, player] - 1
+        shrinks = self.length[hungry, player] > Player.MIN_LENGTH
+        hungry, hungryTargets = hungry[shrinks], hungryTargets[shrinks]
+        oldTails = self.ring[hungry, player, (self.start[hungry, player] + self.length[hungry, player] - 1) % self.cells].astype(np.int64)
+        self.length[hungry, player] = self.length[hungry, player] - 1
+        self.tails[hungry, player] = self.ring[hungry, player, (self.start[hungry, player] + self.length[hungry, player] - 1) % self.cells]
+        # a head that moved onto the old tail keeps the cell
+        vacated = oldTails != hungryTargets
+        self.occupied[hungry[vacated], player, oldTails[vacated]] = False
+
+        starved = games[self.health[games, player] <= 0]
+        self.alive[starved, player] = False
+
+    def step(self, actions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Plays one turn of every unfinished game. actions is a (games, players)
+        array of action ids, missing ones play a random legal move like
+        RandomEnemyAgent. Returns the actions played, NO_MOVE for no move.
+        """
+        played = np.full((self.games, self.numPlayers), BatchSimulator.NO_MOVE, dtype=np.int64)
+        active = np.flatnonzero(~self.done)
+        for player in range(self.numPlayers):
+            games = active[self.alive[active, player]]
+            if len(games) == 0:
+                continue
+            legal = self.legalMoves(player, games)
+            moves = self.randomMoves(legal) if actions is None else actions[games, player]
+            played[games, player] = moves
+            self.move(player, games, moves, legal)
+
+        self.turns[active] = self.turns[active] + 1
+        self.accountForEndState(active)
+        self.spawnFood(active[~self.done[active]])
+        return played
+
+    def accountForEndState(self, games: np.ndarray) -> None:
+        "Same outcomes as GameState.accountForEndState, our player is player 0"
+        alive = self.alive[games].sum(axis=1)
+        tie = alive == 0
+        lost = ~tie & ~self.alive[games, 0]
+        won = ~tie & ~lost & (alive == 1)
+        self.tie[games], self.lost[games], self.won[games] = tie, lost, won
+        self.done[games] = tie | lost | won
+
+    def spawnFood(self, games: np.ndarray) -> None:
+        "Tops the food up to one pellet per alive player, like GameSimulator.ensureMinimumFood but only on free cells"
+        missing = self.alive[games].sum(axis=1) - self.food[games].sum(axis=1, dtype=np.int64)
+        games, missing = games[missing > 0], missing[missing > 0]
+        if len(games) == 0:
+            return
+        taken = self.occupied[games].any(axis=1) | (self.food[games] > 0)
+        keys = np.where(taken, 2.0, self.rng.random(taken.shape))
+        most = int(missing.max())
+        picks = np.argpartition(keys, most - 1, axis=1)[:, :most]
+        # argpartition leaves the picked cells unordered, all are taken before any occupied one
+        for k in range(most):
+            cells = picks[:, k]
+            spawn = (k < missing) & (keys[np.arange(len(games)), cells] < 2.0)
+            self.food[games[spawn], cells[spawn]] = 1
+
+    def toGameState(self, game: int) -> GameState:
+        "The game as a GameState, with player ids 1, 2, ... in player order like the Trainer's games"
+        width = self.width
+
+        def coordinates(cells) -> list:
+            return [{'x': int(cell) % width, 'y': int(cell) // width} for cell in cells]
+
+        snakes = []
+        for player in range(self.numPlayers):
+            body = self.ring[game, player, (self.start[game, player] + np.arange(self.length[game, player])) % self.cells]
+            snakes.append({'health': int(self.health[game, player]), 'body': coordinates(body), 'id': player + 1, 'alive': bool(self.alive[game, player])})
+        food = np.repeat(np.arange(self.cells), self.food[game])
+        gameState = GameState({
+            'board': {'width': width, 'height': self.height, 'food': coordinates(food), 'hazards': [], 'snakes': snakes},
+            'you': {'id': 1}
+        })
+        gameState.accountForEndState()
+        return gameState
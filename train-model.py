@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import torch
+from cnn_dataset import EncodedDataset, preprocess_dataset
+from cnn_inference import load_model
+from cnn_training import train_encoded_model
+
+# python train-model.py [dataset.json] [model.pth] [epochs] [pooled] [workers] [threads], on the JSON or binary examples
+# written by dump-dataset.py, which are preprocessed into a temporary directory first, or on the directory of
+# preprocess-dataset.py, which has to be encoded at the board sizes of the model. Training is checkpointed to
+# model.pth.checkpoint and resumes from it when it exists, the checkpoint is removed once all epochs are done
+datasetPath = sys.argv[1] if len(sys.argv) > 1 else 'dataset.json'
+modelPath = sys.argv[2] if len(sys.argv) > 2 else 'snake-model-1.pth'
+epochs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+pooled = len(sys.argv) > 4 and sys.argv[4] == 'pooled'
+# data loader processes, 0 loads the batches in the training process
+workers = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+# intra-op threads of the model, the cores the loader workers leave by default
+threads = int(sys.argv[6]) if len(sys.argv) > 6 else max((os.cpu_count() or 1) - workers, 1)
+checkpointPath = modelPath + '.checkpoint'
+
+def train(model, directory: str) -> list:
+    dataset = EncodedDataset(directory)
+    if dataset.native != pooled:
+        sys.exit(f"{datasetPath} is encoded for {'pooled' if dataset.native else 'padded'} models")
+    print(f"Training on {dataset.records} records, {len(dataset)} batches, {workers} loader workers, {threads} threads")
+    return train_encoded_model(model, dataset, epochs, workers=workers, checkpoint_path=checkpointPath)
+
+if __name__ == '__main__':
+    torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    model = load_model(None, pooled)
+    if os.path.isdir(datasetPath):
+        train(model, datasetPath)
+    else:
+        # encoded with the same seed every time, so a resumed run sees the same batches
+        with tempfile.TemporaryDirectory() as directory:
+            preprocess_dataset(datasetPath, directory, native=pooled)
+            train(model, directory)
+    torch.save(model.state_dict(), modelPath)
+    if os.path.exists(checkpointPath):
+        os.remove(checkpointPath)
+    print(f"Saved {'pooled' if pooled else 'padded'} model to {modelPath}")
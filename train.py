@@ -1,6 +1,7 @@
 import random
 from typing import Any, List, Optional, Tuple
 from agents import Agent, MinimaxAgent, CustomEncoder
+from dataset import DatasetWriter
 from game import Actions, GameRules, GameState, Player
 import util
 import json
@@ -39,17 +40,33 @@ class Stats(TrainableAgent):
         print(f"Wins: {self.numWins}, Losses: {self.numLosses}, Ties: {self.numTies}, Win rate: {round(100.0 * self.numWins / self.totalEpisodes)}%")
 
 class DataDumpAgent(TrainableAgent):
-    def __init__(self) -> None:
+    """
+    Records the transitions of our snake, played by agent or by random legal
+    moves without one. With a writer they are streamed to it an episode at a
+    time instead of being kept in dataset.
+    """
+    def __init__(self, agent: Optional[Agent] = None, writer: Optional[DatasetWriter] = None) -> None:
         self.dataset = []
+        self.agent = agent
+        self.writer = writer
 
     def getAction(self, gameState: GameState) -> Optional[str]:
+        if self.agent is not None:
+            return self.agent.getAction(gameState)
+
         legalMoves = gameState.getLegalActions()
         selectedChoice = random.choice(legalMoves) if len(legalMoves) > 0 else None
 
         return selectedChoice
 
     def learn(self, beforeState: GameState, afterState: GameState, action: str):
-        self.dataset.append({'gameState': beforeState, 'action': action, 'reward': self.getReward(beforeState, afterState), 'nextState': afterState})
+        record = {'gameState': beforeState, 'action': action, 'reward': self.getReward(beforeState, afterState), 'nextState': afterState}
+        if self.writer is None:
+            self.dataset.append(record)
+            return
+        self.writer.append(record)
+        if afterState.isEndState():
+            self.writer.endEpisode()
 
     def getReward(self, beforeState: GameState, afterState: GameState) -> float:
         if afterState.isEndState():
@@ -66,22 +83,27 @@ class DataDumpAgent(TrainableAgent):
                 return 0.0
 
     def dump(self, filename: str):
-        print(f"Dumped {len(self.dataset)} records")
-        out_file = open(filename, 'w')
-        json.dump(self.dataset, out_file, indent=4, cls=CustomEncoder)
+        dumpDataset(self.dataset, filename)
+
+def dumpDataset(dataset: List, filename: str) -> None:
+    print(f"Dumped {len(dataset)} records")
+    out_file = open(filename, 'w')
+    json.dump(dataset, out_file, indent=4, cls=CustomEncoder)
 
 class Trainer:
-    def __init__(self, enemyAgents: List[Agent], width: int = 11, height: int = 11) -> None:
+    def __init__(self, enemyAgents: List[Agent], width: int = 11, height: int = 11, verbose: bool = True) -> None:
         self.numEnemies = len(enemyAgents)
         self.enemyAgents = enemyAgents
         self.numEpisodes = 0
+        self.numMoves = 0
         self.width = width
         self.height = height
+        # prints a line for every move and episode
+        self.verbose = verbose
 
     def train(self, agent: TrainableAgent, numEpisodes: int):
         currentEpisodes = self.numEpisodes
         endEpisodes = currentEpisodes + numEpisodes
-        numMoves = 0
 
         while self.numEpisodes < endEpisodes:
             # new game episode
@@ -108,14 +130,16 @@ class Trainer:
                 afterState.accountForEndState()
                 agent.learn(beforeState, afterState, ourAction)
 
-                numMoves = numMoves + 1
-                print(f"Move #{numMoves} complete")
+                self.numMoves = self.numMoves + 1
+                if self.verbose:
+                    print(f"Move #{self.numMoves} complete")
 
                 # print(f"transitioned from {beforeState.players} to {currentState.players}")
                 GameSimulator.ensureMinimumFood(currentState)
             # print(f"transitioned from {beforeState.players} to {currentState.players}")
             self.numEpisodes = self.numEpisodes + 1
-            print(f"Episode #{self.numEpisodes} complete")
+            if self.verbose:
+                print(f"Episode #{self.numEpisodes} complete")
         
 class GameSimulator:
     def getRandomGameState(width: int, height: int, numEnemies: int) -> GameState:
@@ -159,6 +183,22 @@ class GameSimulator:
         return gameState
     getRandomGameState = staticmethod(getRandomGameState)
     
+    def getRandomPositions(width: int, height: int, numEnemies: int, count: int, maxRounds: int) -> List[GameState]:
+        "Ongoing positions reached by random play, used as fixed corpora for the benchmarks"
+        positions = []
+        while len(positions) < count:
+            gameState = GameSimulator.getRandomGameState(width, height, numEnemies)
+            for _ in range(random.randint(0, maxRounds)):
+                for index in range(len(gameState.players)):
+                    legalMoves = gameState.getLegalActions(index)
+                    if len(legalMoves) > 0 and not gameState.isEndState():
+                        gameState.makeMove(random.choice(legalMoves), index, False)
+                GameSimulator.ensureMinimumFood(gameState)
+            if not gameState.isEndState() and len(gameState.getLegalActions(0)) > 0:
+                positions.append(gameState)
+        return positions
+    getRandomPositions = staticmethod(getRandomPositions)
+    
     def ensureMinimumFood(gameState: GameState, minFoodPellets: int = 0) -> None:
         alivePlayers = gameState.getAlivePlayers()
         
@@ -178,5 +218,6 @@ class GameSimulator:
             food.append(foodPelletLocation)
         
         gameState.food = food
+        gameState.rehash()
     ensureMinimumFood = staticmethod(ensureMinimumFood)
 
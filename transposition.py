@@ -0,0 +1,160 @@
+from __future__ import annotations
+from collections import OrderedDict
+import random
+from typing import Dict, List, Optional, Tuple
+
+class ZobristKeys:
+    "Random 64 bit keys for incrementally hashing the game states of one board size and player count."
+    # health values sharing a bucket hash the same
+    HEALTH_BUCKET = 1
+    MAX_HEALTH = 100
+
+    _boards: Dict[Tuple[int, int, int], ZobristKeys] = {}
+
+    def __init__(self, width: int, height: int, numPlayers: int) -> None:
+        # seeded so that hashes are stable across processes
+        rng = random.Random(width * 1000003 + height * 1009 + numPlayers)
+        cells = width * height
+        self.width = width
+        self.body = [[rng.getrandbits(64) for _ in range(cells)] for _ in range(numPlayers)]
+        self.head = [[rng.getrandbits(64) for _ in range(cells)] for _ in range(numPlayers)]
+        self.health = [[rng.getrandbits(64) for _ in range(ZobristKeys.MAX_HEALTH // ZobristKeys.HEALTH_BUCKET + 1)] for _ in range(numPlayers)]
+        self.alive = [rng.getrandbits(64) for _ in range(numPlayers)]
+        self.food = [rng.getrandbits(64) for _ in range(cells)]
+        self.toMove = [rng.getrandbits(64) for _ in range(numPlayers)]
+        # for players the search models with a default policy instead of searching their moves
+        self.defaultPolicy = [rng.getrandbits(64) for _ in range(numPlayers)]
+        # hazards don't change during a search, but they do between the turns of a game
+        self.hazard = [rng.getrandbits(64) for _ in range(cells)]
+        # by number of body segments stacked on a cell another segment holds, 0 for none
+        self.stacked = [[0] + [rng.getrandbits(64) for _ in range(cells)] for _ in range(numPlayers)]
+
+    def forBoard(width: int, height: int, numPlayers: int) -> ZobristKeys:
+        board = (width, height, numPlayers)
+        if board not in ZobristKeys._boards:
+            ZobristKeys._boards[board] = ZobristKeys(width, height, numPlayers)
+        return ZobristKeys._boards[board]
+    forBoard = staticmethod(forBoard)
+
+    def healthBucket(health: int) -> int:
+        return min(max(health, 0), ZobristKeys.MAX_HEALTH) // ZobristKeys.HEALTH_BUCKET
+    healthBucket = staticmethod(healthBucket)
+
+    def hashState(self, gameState) -> int:
+        """
+        Full hash of a game state, GameState.makeMove keeps it up to date
+        incrementally. Each occupied cell is hashed once, so that stacked
+        segments don't cancel out, and the number of stacked ones separately.
+        """
+        width = self.width
+        key = gameState.ruleset.hashKey
+        for i in range(len(gameState.players)):
+            player = gameState.players[i]
+            body = self.body[i]
+            cells = set([y * width + x for (x, y) in player.body])
+            for cell in cells:
+                key = key ^ body[cell]
+            key = key ^ self.stacked[i][len(player.body) - len(cells)]
+            if player.head is not None:
+                x, y = player.head
+                key = key ^ self.head[i][y * width + x]
+            key = key ^ self.health[i][ZobristKeys.healthBucket(player.health)]
+            if player.alive:
+                key = key ^ self.alive[i]
+        for cell in set([y * width + x for (x, y) in gameState.food]):
+            key = key ^ self.food[cell]
+        for cell in set([y * width + x for (x, y) in gameState.hazards]):
+            key = key ^ self.hazard[cell]
+        return key
+
+class TranspositionTable:
+    "Fixed size table of search results keyed by position hash, with depth-preferred replacement."
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+    DEFAULT_SIZE = 1 << 18
+
+    def __init__(self, size: int = DEFAULT_SIZE) -> None:
+        self.size = size
+        # (key, depth, value, bound, move) per slot
+        self.entries: List[Optional[Tuple[int, int, float, int, Optional[str]]]] = [None] * size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int, float, int, Optional[str]]]:
+        entry = self.entries[key % self.size]
+        if entry is None:
+            self.misses = self.misses + 1
+            return None
+        if entry[0] != key:
+            # slot taken by another position
+            self.collisions = self.collisions + 1
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        return entry
+
+    def store(self, key: int, depth: int, value: float, bound: int, move: Optional[str]) -> None:
+        slot = key % self.size
+        entry = self.entries[slot]
+        if entry is None or entry[0] == key or depth >= entry[1]:
+            self.entries[slot] = (key, depth, value, bound, move)
+
+    def clear(self) -> None:
+        self.entries = [None] * self.size
+        self.resetStats()
+
+    def resetStats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def getStats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'collisions': self.collisions}
+
+class EvaluationCache:
+    "Bounded LRU cache of static evaluations keyed by position hash, kept for the turns of one game."
+    # rough memory of one entry: the int key, the float value and the OrderedDict slot
+    ENTRY_BYTES = 160
+    DEFAULT_MEGABYTES = 16
+
+    def __init__(self, maxEntries: int) -> None:
+        self.maxEntries = maxEntries
+        self.entries: OrderedDict[int, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def forMemory(megabytes: float = DEFAULT_MEGABYTES) -> EvaluationCache:
+        return EvaluationCache(max(int(megabytes * (1 << 20)) // EvaluationCache.ENTRY_BYTES, 1))
+    forMemory = staticmethod(forMemory)
+
+    def lookup(self, key: int) -> Optional[float]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key: int, value: float) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxEntries:
+            # least recently used first
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.resetStats()
+
+    def resetStats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getStats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries)}
@@ -4,4 +4,10 @@ def getCoordinates(coords: List[Dict]) -> List[Tuple[int, int]]:
     return [(coord['x'], coord['y']) for coord in coords]
 
 def getDictCoordinates(coords: List[Tuple[int, int]]) -> List[Dict]:
-    return [{'x': x, 'y': y} for (x, y) in coords]
\ No newline at end of file
+    return [{'x': x, 'y': y} for (x, y) in coords]
+
+def getMask(coords: List[Tuple[int, int]], width: int) -> int:
+    mask = 0
+    for (x, y) in coords:
+        mask = mask | (1 << (y * width + x))
+    return mask
\ No newline at end of file